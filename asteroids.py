@@ -4,6 +4,8 @@ Program             :   Asteroids
 Programmer          :   Damian Duffy
 Date                :   April 2018
 Description         :   Game based on the classic Asteroids arcade game
+Usage               :   python asteroids.py
+                        python asteroids.py --self-test
 '''
 
 # import required packages
@@ -11,40 +13,184 @@ import sys
 import os
 import random
 import math
+import time
+import zlib
 import pygame
 from pygame.locals import *
 from pygame.math import Vector2
 import config
+from rotation import RotationCache
+from spatial import SpatialHash, dist_sq
+from collision import Narrowphase
+from wrap import EdgeBand, SLACK
+from camera import Camera
+from physics import AsteroidField, AsteroidHandle, interpolate
+from render import DirtyRenderer, RenderQueue, BACKGROUND, HUD, SPRITES, ASTEROIDS, EXPLOSIONS, MISSILES
+from hud import Hud
+from profiler import FrameProfiler
+from pool import SpritePool, release
+from missiles import MissileBuffer
+from atlas import Atlas
+from bundle import AssetBundle
+from replay import Recording
+from spawn import SpawnPlanner
+from pipeline import Snapshot, TripleBuffer, PipelineStats, SimulationThread
+from latency import InputLatency, wait_until
+from background import LayerStack
+from governor import Governor
+import snapshot
 # from config.locals import *           TBC - See if this works???
 
-# initialise pygame
-pygame.init()
-if config.FULLSCREEN == False:
-    screen = pygame.display.set_mode(config.SCREENSIZE)
-else:
-    screen = pygame.display.set_mode(config.SCREENSIZE, pygame.FULLSCREEN)
-pygame.mouse.set_visible(config.DISPLAY_MOUSE)
-pygame.display.set_caption(config.TITLE)
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, 25)
-
-# Set globals
+# Set globals; the display, clock and font are created by init()
+screen = None
+clock = None
+font = None
+hud = None
+bundle = None
+recording = None
+input_latency = None
+governor = None
+encoder = None
+rewind_buffer = None
+spectator = None
+renderer = None
+render_queue = None
+spawn_planner = None
+headless = False
 enemy_group = set([])
 missile_group = set([])
 explosion_group = set([])
+enemy_index = SpatialHash()
+visible_enemies = enemy_group      # the asteroids on screen, see Camera.cull
+score = 0
+difficulty = 0
+tick_count = 0
+entity_ids = {}
+next_entity_id = 1
+rotation_cache = RotationCache()
+edge_band = EdgeBand()
+camera = Camera()
+# collision masks come from their own cache so the quality governor, which
+# changes the step and filtering of rotation_cache, cannot change hits
+mask_cache = RotationCache()
+narrowphase = Narrowphase(mask_cache, edge_band)
+atlas = Atlas()
+profiler = FrameProfiler()
+# quality settings turned by the governor
+hud_interval = 1
+hud_frames = 0
+explosion_frame_skip = 1
+background_layer_count = None
+enemy_scale = 1.0
+rotation_cache.timed = profiler.enabled
+
+# initialise pygame; headless mode uses SDL's dummy drivers so no window is
+# opened and the game logic can run on machines without a display
+def init(run_headless = False):
+    global screen, clock, font, hud, bundle, renderer, render_queue, spawn_planner, headless
+    if screen is not None:
+        return
+    headless = run_headless
+    if headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    pygame.init()
+    if config.FULLSCREEN == False or headless:
+        screen = pygame.display.set_mode(config.SCREENSIZE)
+    else:
+        screen = pygame.display.set_mode(config.SCREENSIZE, pygame.FULLSCREEN)
+    pygame.mouse.set_visible(config.DISPLAY_MOUSE)
+    pygame.display.set_caption(config.TITLE)
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None, 25)
+    hud = build_hud()
+    render_queue = RenderQueue(screen)
+    if config.DIRTY_RECTS:
+        renderer = DirtyRenderer(screen)
+    bundle = AssetBundle.open(config.ASSET_BUNDLE)
+    # without numpy the spawner falls back to one random position per frame
+    if config.VECTOR_SPAWN:
+        try:
+            spawn_planner = SpawnPlanner()
+        except ImportError:
+            spawn_planner = None
+    load_resources()
+
+# on-screen text; static labels are fields without a value
+def build_hud():
+    hud = Hud(font)
+    hud.add('lives', "Lives: ", (450, 10))
+    hud.add('score', "Score: ", (450, 40))
+    hud.add('top_score', "Top Score: ", (450, 70))
+    hud.add('fps', "FPS: ", (550, 10))
+    hud.show('fps', config.SHOW_FPS)
+    hud.add('visible', "Visible: ", (550, 40))
+    hud.show('visible', camera.scrolling)
+    return hud
 
 # pause the game
 def pause_game():
     pass
 
+# show or hide the profiler overlay; recording starts with the first toggle
+def toggle_profiler():
+    profiler.overlay = not profiler.overlay
+    if profiler.overlay and not profiler.enabled:
+        profiler.enabled = True
+        rotation_cache.timed = True
+        profiler.begin_frame()
+
 # exit the game
 def exit_game():
+    if recording is not None:
+        recording.save(config.RECORD_FILE)
+        print('recording written to', config.RECORD_FILE)
+    if profiler.count:
+        print('profile written to', profiler.export())
+    if input_latency is not None:
+        print(input_latency.report())
+    if governor is not None and governor.log:
+        print('governor log written to', governor.export())
     pygame.quit()
     sys.exit()
 
-# start a new game
+# governor callback; each knob maps onto the part of the game it controls
+def apply_quality(knob, value):
+    global hud_interval, explosion_frame_skip, background_layer_count, enemy_scale
+    if knob == 'hud_interval':
+        hud_interval = value
+    elif knob == 'explosion_frame_skip':
+        explosion_frame_skip = value
+    elif knob == 'smooth_rotation':
+        rotation_cache.set_smooth(value)
+    elif knob == 'rotation_step':
+        rotation_cache.set_step(config.ROTATION_STEP if value is None else value)
+    elif knob == 'background_layers':
+        background_layer_count = value
+    elif knob == 'enemy_cap' and recording is None:
+        # the cap changes the simulation, which a replay could not reproduce
+        enemy_scale = value
+
+# empty every sprite group
+def clear_arena():
+    for group in (enemy_group, missile_group, explosion_group):
+        release(group)
+        group.clear()
+    enemy_index.clear()
+    visible_enemies.clear()
+    if asteroid_field is not None:
+        asteroid_field.prune()
+
+# start a new game; clears the arena and returns a fresh player
 def new_game():
-    pass
+    global score, difficulty, tick_count
+    clear_arena()
+    if spawn_planner is not None:
+        spawn_planner.reset(random.getrandbits(32))
+    score = 0
+    difficulty = 0
+    tick_count = 0
+    return Spaceship([100, 100], [0, 0], 0, 0, get_image('ship'), ship_info)
 
 # Event handler
 def key_down(event, player):
@@ -52,6 +198,8 @@ def key_down(event, player):
         exit_game()
     if event.key == K_p:
         pause_game()
+    if event.key == K_F3:
+        toggle_profiler()
     if event.key == K_UP:
         player.set_thrust(True)
     if event.key == K_LEFT:
@@ -60,6 +208,14 @@ def key_down(event, player):
         player.set_turn(1)
     if event.key == K_SPACE:
         player.shoot()
+    # a recording could not replay a jump in the game state
+    if recording is None:
+        if event.key == K_F5:
+            save_game(player)
+        if event.key == K_F9:
+            load_game(player)
+        if event.key == K_BACKSPACE:
+            rewind_game(player)
 
 def key_up(event, player):
     if event.key == K_ESCAPE:
@@ -72,13 +228,43 @@ def key_up(event, player):
         player.set_turn(1)
     if event.key == K_RIGHT:
         player.set_turn(-1)
+    if event.key == K_SPACE:
+        player.shoot(False)
+
+# pull pending events; stamped for latency tracking when it is on
+def poll_events():
+    if input_latency is not None:
+        return input_latency.get()
+    return pygame.event.get()
+
+# True once a key event is waiting; ends a low latency wait early
+def key_waiting():
+    if input_latency is not None:
+        return input_latency.key_waiting()
+    return pygame.event.peek((KEYDOWN, KEYUP))
+
+def handle_events(player, events):
+    for event in events:
+        if recording is not None:
+            recording.add_event(event)
+        if event.type == KEYDOWN:
+            key_down(event, player)
+        if event.type == KEYUP:
+            key_up(event, player)
 
 # load image files
 def load_image(name, colorkey = None):
     fullname = os.path.join('gfx/', name)
 
     try:
-        image = pygame.image.load(fullname)
+        # the bundle holds pre-decoded pixels in the display format; only new
+        # images hit the PNG decoder
+        if bundle is not None and name in bundle:
+            image = bundle.image(name)
+            if colorkey is None:
+                return image
+        else:
+            image = pygame.image.load(fullname)
     except pygame.error as message:
         print('Cannot load image:', name)
         print(os.getcwd())
@@ -106,7 +292,10 @@ def load_sound(name):
     fullname = os.path.join('snd/', name)
 
     try:
-        sound = pygame.mixer.Sound(fullname)
+        if bundle is not None and name in bundle:
+            sound = bundle.sound(name)
+        else:
+            sound = pygame.mixer.Sound(fullname)
     except pygame.error as message:
         print('Cannot load sound:', name)
         raise SystemExit(message)
@@ -122,37 +311,95 @@ def angle_to_vector(ang):
 def dist(p, q):
     return math.sqrt((p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2)
 
-def group_dist(group, position):
+# check a position is clear of every sprite in a group; the index narrows
+# the search to nearby sprites, without it every sprite is checked
+def group_dist(group, position, index = None):
+    if index is not None:
+        group = index.query(position, index.max_radius * 4)
     for sprite in group:
-        if dist(position, sprite.get_position()) < (sprite.get_radius() * 4):
+        reach = sprite.get_radius() * 4
+        if dist_sq(position, sprite.get_position()) < reach * reach:
             return False
     return True
 
 # Draw and update groups of sprites
-def process_sprite_group(sprites):
+def process_sprite_group(sprites, draw = True):
     expired = set([])
     for sprite in sprites:
-        sprite.draw()
+        if draw:
+            sprite.draw()
         # update() returns true if the sprite has a finite lifespan
         if sprite.update():
             # create set of sprites which exceed their lifespan
             expired.add(sprite)
     # remove sprites that exceed lifespan
     sprites -= expired
-
-def group_collide(group, other_object):
+    release(expired)
+
+# colliding pairs between two groups; without an index every pair is tested,
+# which is the brute force reference used to cross-check the broadphase
+def collision_pairs(group, other_group, index = None):
+    pairs = set([])
+    for other in other_group:
+        if index is not None:
+            candidates = index.query(other.get_position(), other.get_radius() + index.max_radius)
+        else:
+            candidates = group
+        for sprite in candidates:
+            if narrowphase.test(sprite, other):
+                pairs.add((sprite, other))
+    return pairs
+
+# cross-check the broadphase on random fields: collision_pairs() through
+# enemy_index must find exactly the pairs the brute force does. Half the
+# sprites sit on an edge, so pairs that only meet across it are covered.
+# Returns the number of pairs found
+def self_test(fields = 20, count = 300, seed = 12345):
+    init(run_headless = True)
+    random.seed(seed)
+    width, height = config.WORLDSIZE
+    found = 0
+    for field in range(fields):
+        player = new_game()
+        positions = [[random.uniform(0, width), random.uniform(0, height)] for i in range(count)]
+        for pos in positions[::2]:
+            axis = random.randrange(2)
+            pos[axis] = random.uniform(-50, 50) % config.WORLDSIZE[axis]
+        for pos in positions[:count // 2]:
+            enemy_group.add(new_asteroid(pos, [0, 0], random.randrange(360), 0))
+        others = set(Sprite(pos, [0, 0], random.randrange(360), 0, get_image('asteroid'), asteroid_info)
+                     for pos in positions[count // 2:])
+        enemy_index.rebuild(enemy_group)
+        edge_band.find(player, enemy_index, None, enemy_group)
+        edge_band.scan(others)
+        expected = collision_pairs(enemy_group, others)
+        pairs = collision_pairs(enemy_group, others, enemy_index)
+        if pairs != expected:
+            raise AssertionError('field %d: the broadphase found %d pairs, the brute force %d'
+                                 % (field, len(pairs), len(expected)))
+        found += len(pairs)
+    clear_arena()
+    return found
+
+def group_collide(group, other_object, index = None):
     global lives
     # hit will be returned
     hit = False
     # temp_group used to store sprites for removal after iteration has completed
     temp_group = set([])
 
-    for sprite in group:
-        if sprite.collide(other_object):
+    # only sprites sharing nearby cells with other_object need the exact test
+    if index is not None:
+        candidates = index.query(other_object.get_position(), other_object.get_radius() + index.max_radius)
+    else:
+        candidates = group
+
+    for sprite in candidates:
+        if sprite in group and narrowphase.test(sprite, other_object):
             # add the collided sprite to the temporary group
             temp_group.add(sprite)
             # add sprite to the explosions group
-            explosion_group.add(Sprite(other_object.get_position(), [0, 0], 0, 0, explosion_image, explosion_info, explosion_sound))
+            explosion_group.add(explosion_pool.acquire(other_object.get_position(), [0, 0], 0, 0, get_image('explosion'), explosion_info, explosion_sound))
             # play the explosion sound
             # explosion_sound.stop()
             # explosion_sound.play()
@@ -160,16 +407,20 @@ def group_collide(group, other_object):
 
     # remove sprites from the group which were involved in collisions
     group.difference_update(temp_group)
+    if index is not None:
+        for sprite in temp_group:
+            index.remove(sprite)
+    release(temp_group)
 
     return hit
 
-def group_group_collide(other_group, group):
+def group_group_collide(other_group, group, index = None):
     global score, difficulty
     # temp_group used to store sprites for removal after iteration has completed
     temp_group = set([])
 
     for sprite in group:
-        if group_collide(other_group, sprite):
+        if group_collide(other_group, sprite, index):
             temp_group.add(sprite)
 
             # remove sprites which have been involved in collision
@@ -182,50 +433,77 @@ def group_group_collide(other_group, group):
 
     # remove sprites from the group which were involved in collisions
     group.difference_update(temp_group)
+    release(temp_group)
 
 def enemy_spawner(player_pos, player_radius):
     # check for the max number of enemies allowed at any time
-    if len(enemy_group) < config.MAX_ENEMY_SPRITES:
+    if len(enemy_group) < config.MAX_ENEMY_SPRITES * enemy_scale:
         # generate enemy properties
         # difficulty is incremented with the player score
         # and results in higher velocity enemies being generated
 
-        # randomly spam all over the screen (like asteroids)
-        enemy_pos = [random.randrange(0, config.SCREENSIZE[0]), random.randrange(0, config.SCREENSIZE[1])]
+        # don't spawn asteroids too close to the ship (within twice the distance between centers)
+        player_clearance = (asteroid_info.get_radius() + player_radius) * 2
+        if spawn_planner is not None:
+            # batches of candidates are also kept clear of every other asteroid
+            enemy_pos = spawn_planner.place(player_pos, player_clearance, enemies_near, asteroid_info.get_radius() * 2)
+            if enemy_pos is None:
+                return
+        else:
+            # randomly spam all over the screen (like asteroids)
+            enemy_pos = [random.randrange(0, config.WORLDSIZE[0]), random.randrange(0, config.WORLDSIZE[1])]
+            if dist(enemy_pos, player_pos) <= player_clearance:
+                return
         enemy_vel = [random.random() * config.DIFFICULTY * random.choice([-1, 1]), random.random() * config.DIFFICULTY * random.choice([-1, 1])]
         # enemy_avel = (random.random() / 10) * random.choice([-1, 1])
-        # don't spawn asteroids too close to the ship (within twice the distance between centers)
-        if dist(enemy_pos, player_pos) > ((asteroid_info.get_radius() + player_radius) * 2):
-            enemy_group.add(Asteroid(enemy_pos, enemy_vel, 0, 0, asteroid_image, asteroid_info))
+        enemy_group.add(new_asteroid(enemy_pos, enemy_vel, 0, 0))
+
+# centres of the asteroids in the grid cells within reach of a position, for
+# the spawn planner. The grid is last tick's, and nothing has moved since
+def enemies_near(pos, reach):
+    return (sprite.get_position() for sprite in enemy_index.query(pos, reach))
+
+# create an asteroid; a handle into the batched field when it is enabled
+def new_asteroid(pos, vel, ang, ang_vel):
+    if asteroid_field is not None:
+        return asteroid_field.spawn(pos, vel, ang, ang_vel, get_image('asteroid'), asteroid_info)
+    return asteroid_pool.acquire(pos, vel, ang, ang_vel, get_image('asteroid'), asteroid_info)
 
 class Background:
     def __init__(self):
-        self.nebula = None
-        self.debris = None
-        self.debris_x_scroll_rate = config.DEBRIS_SCROLL_RATE[0]
-        self.debris_y_scroll_rate = config.DEBRIS_SCROLL_RATE[1]
-        self.debris_pos = [0, 0]
+        self.layers = LayerStack(get_image('background'), config.SCREENSIZE)
+        self.moved = False
 
     def update(self):
-        self.debris_pos[0] += self.debris_x_scroll_rate
-        self.debris_pos[1] += self.debris_y_scroll_rate
-        if self.debris_pos[0] < (0 - config.SCREENSIZE[0]):
-            self.debris_pos = [0, 0]
+        self.moved = self.layers.update()
 
+    # queue the scenery and the HUD; see draw_world
     def draw(self, player):
-        screen.blit(nebula_image, (0, 0))
-        screen.blit(debris_image, self.debris_pos)
-        screen.blit(debris_image, (self.debris_pos[0] + config.SCREENSIZE[0], self.debris_pos[1]))
-        # on-screen display of information
-        fps = font.render("FPS: " + str(int(clock.get_fps())), True, pygame.Color('white'))
-        lives = font.render("Lives: " + str(player.get_lives()), True, pygame.Color('white'))
-        score = font.render("Score: " + str(player.get_score()), True, pygame.Color('white'))
-        top_score = font.render("Top Score: ", True, pygame.Color('white'))
-        screen.blit(lives, (450, 10))
-        screen.blit(score, (450, 40))
-        screen.blit(top_score, (450, 70))
-        if config.SHOW_FPS:
-            screen.blit(fps, (550, 10))
+        self.draw_scenery()
+        self.draw_hud(player)
+
+    def draw_scenery(self):
+        render_queue.extend(self.layers.get_blits(background_layer_count), BACKGROUND)
+
+    # restore the scenery under a rect, erasing whatever was drawn there
+    def draw_area(self, rect):
+        self.layers.draw_area(screen, rect, background_layer_count)
+
+    # on-screen display of information; the values are refreshed every
+    # hud_interval frames
+    def draw_hud(self, player):
+        global hud_frames
+        if hud_frames % hud_interval == 0:
+            hud.set('lives', player.get_lives())
+            # the game's score; group_group_collide counts the hits there
+            hud.set('score', score)
+            if config.SHOW_FPS:
+                hud.set('fps', int(clock.get_fps()))
+            if camera.scrolling:
+                stats = camera.get_stats()
+                hud.set('visible', '%d/%d' % (stats['visible'], stats['total']))
+        hud_frames += 1
+        render_queue.extend(hud.get_blits(), HUD)
 
 # Image class to hold image information
 class ImageInfo:
@@ -259,10 +537,27 @@ class ImageInfo:
         return self.animated
 
 # Sprite class to define basic sprite characteristics
+# __slots__ keeps instances small; pooled sprites are recycled via reset()
 class Sprite:
+    __slots__ = ('pos', 'vel', 'angle', 'angle_vel', 'image', 'image_center', 'image_size',
+                 'radius', 'lifespan', 'animated', 'age', 'orig_image', 'rect', 'offset',
+                 'prev_pos', 'pool', 'frames', 'tick')
+
     def __init__(self, pos, vel, ang, ang_vel, image, info, sound = None):
         self.pos = Vector2(pos)  # The original center position/pivot point.
-        self.vel = vel
+        self.vel = [0, 0]
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.offset = Vector2(0, 0)  # We shift the sprite 50 px to the right.
+        self.prev_pos = Vector2(pos)  # position at the previous tick, for interpolation
+        self.pool = None  # set by the SpritePool the sprite was acquired from
+        self.reset(pos, vel, ang, ang_vel, image, info, sound)
+
+    # (re)initialise the sprite in place, reusing its vectors and rect
+    def reset(self, pos, vel, ang, ang_vel, image, info, sound = None):
+        self.pos.update(pos)
+        self.prev_pos.update(pos)
+        self.vel[0] = vel[0]
+        self.vel[1] = vel[1]
         self.angle = ang
         self.angle_vel = ang_vel
         self.image = image
@@ -272,53 +567,73 @@ class Sprite:
         self.lifespan = info.get_lifespan()
         self.animated = info.get_animated()
         self.age = 0
+        self.tick = tick_count  # tick the sprite was last updated to
         if sound:
             sound.stop()
             sound.play()
+        # animated sheets are drawn one frame at a time
+        if info.get_frames() > 1:
+            self.frames = atlas.frames(image, info)
+            self.image = self.frames[0]
+        else:
+            self.frames = None
         self.orig_image = self.image
-        self.rect = self.image.get_rect(center=pos)
-        #self.pos = Vector2(pos)  # The original center position/pivot point.
-        self.offset = Vector2(0, 0)  # We shift the sprite 50 px to the right.
-        #self.angle = 0
-
-    def draw(self):
-        screen.blit(self.image, self.rect) #self.pos)
-        """
-        if self.animated:
-            frames = [] # a list for the sprite frames
-            # each frame has 128 x 128 pixels
-            for nbr in range(1,25,1): # 24 frames in spritesheet
-                frames.append(explosion_image.subsurface((127*(nbr-1),0,127,127)))
-            for nbr in range(len(frames)):
-                windowSurfaceObj.blit(frames[nbr], self.pos)
-            '''
-            current_animation_index = [self.image_center[0] + (self.image_size[0] * (self.age / 3)), self.image_center[1]]
-            windowSurfaceObj.blit(self.image, current_animation_index, self.image_size, self.pos)
-            '''
-            self.age += 1
+        self.rect.size = self.image.get_size()
+        self.rect.center = pos
+
+    # the image and screen rect to draw; alpha is the fraction of a tick
+    # elapsed since the last update, None draws at the position set by the
+    # last update. The rect stays in world space; the camera places a copy
+    # on screen
+    def get_blit(self, alpha = None):
+        if alpha is not None:
+            self.rect.center = interpolate(self.prev_pos, self.pos, alpha)
+        return self.image, camera.place(self.rect)
+
+    def draw(self, alpha = None):
+        return screen.blit(*self.get_blit(alpha)) #self.pos)
+
+    # pick the sheet frame for the sprite's age; frames were cut at load time
+    # so nothing is allocated here
+    def animate(self):
+        if self.lifespan == float('inf'):
+            index = self.age % len(self.frames)
         else:
-            windowSurfaceObj.blit(self.image, self.pos)
-        """
+            index = min(len(self.frames) - 1, self.age * len(self.frames) // self.lifespan)
+            index -= index % explosion_frame_skip
+        self.orig_image = self.frames[index]
+
     def rotate(self):
         """Rotate the image of the sprite around a pivot point."""
-        # Rotate the image.
-        self.image = pygame.transform.rotozoom(self.orig_image, self.angle, 1)
-        # Rotate the offset vector.
-        offset_rotated = self.offset.rotate(self.angle)
-        # Create a new rect with the center of the sprite + the offset.
-        self.rect = self.image.get_rect(center=self.pos+offset_rotated)
+        # Fetch the pre-rotated image from the shared cache.
+        self.image = rotation_cache.get(self.orig_image, self.angle)
+        # Resize the rect in place and centre it on the sprite + the
+        # rotated offset vector.
+        self.rect.size = self.image.get_size()
+        if self.offset:
+            self.rect.center = self.pos + self.offset.rotate(self.angle)
+        else:
+            self.rect.center = self.pos
 
-    def update(self):
+    # steps is the number of ticks to advance; more than one catches up a
+    # sleeping asteroid, see update_asteroids()
+    def update(self, steps = 1):
+        self.prev_pos.update(self.pos)
         # update angle
-        self.angle = (self.angle + self.angle_vel) % 360
+        self.angle = (self.angle + self.angle_vel * steps) % 360
+        if self.animated:
+            self.animate()
 
-        self.set_pos()
-        self.rotate()
+        self.set_pos(steps)
+        # off-screen sprites keep their last rotated image
+        if camera.sees(self.pos):
+            self.rotate()
 
-        self.pos[0] = (self.pos[0] + self.vel[0]) % (config.SCREENSIZE[0] + self.radius)
-        self.pos[1] = (self.pos[1] + self.vel[1]) % (config.SCREENSIZE[1] + self.radius)
+        self.pos[0] = (self.pos[0] + self.vel[0] * steps) % config.WORLDSIZE[0]
+        self.pos[1] = (self.pos[1] + self.vel[1] * steps) % config.WORLDSIZE[1]
 
-        self.age += 1
+        self.age += steps
+        self.tick += steps
 
         if self.age >= self.lifespan:
             return True
@@ -331,8 +646,12 @@ class Sprite:
     def get_position(self):
         return self.pos
 
+    def get_angle(self):
+        return self.angle
+
+    # pos is already the centre of the sprite (the rect is centred on it)
     def get_centre(self):
-        return [self.pos[0] + self.image_center[0], self.pos[1] + self.center[1]]
+        return self.pos
 
     def set_vel(self, x_vel = None, y_vel = None):
         if x_vel:
@@ -340,24 +659,30 @@ class Sprite:
         if y_vel:
             self.vel[1] += y_vel
 
-    def set_pos(self):
-        self.pos[0] += self.vel[0]
-        self.pos[1] += self.vel[1]
+    def set_pos(self, steps = 1):
+        self.pos[0] += self.vel[0] * steps
+        self.pos[1] += self.vel[1] * steps
 
     # check if the sprite was involved in a collision and return true if it has
     def collide(self, other_object):
-        if dist(self.get_centre(), other_object.get_centre()) < (self.get_radius() + other_object.get_radius()):
+        radii = self.get_radius() + other_object.get_radius()
+        if dist_sq(self.get_centre(), other_object.get_centre()) < radii * radii:
             return True
         else:
             return False
 
 # Asteroid class
 class Asteroid(Sprite):
+    __slots__ = ()
+
     def __init__ (self, pos, vel, ang, ang_vel, image, info, sound = None):
         Sprite.__init__(self, pos, vel, ang, ang_vel, image, info, sound = None)
 
 # Spaceship class
 class Spaceship(Sprite):
+    __slots__ = ('thrust', 'speed', 'accel', 'decel', 'max_speed', 'turn', 'lives', 'score',
+                 'firing', 'reload')
+
     def __init__ (self, pos, vel, ang, ang_vel, image, info, sound = None):
         Sprite.__init__(self, pos, vel, ang, ang_vel, image, info, sound = None)
         self.thrust = False
@@ -368,6 +693,8 @@ class Spaceship(Sprite):
         self.turn = 0
         self.lives = 3
         self.score = 0
+        self.firing = False
+        self.reload = 0
 
     def get_score(self):
         return self.score
@@ -413,16 +740,32 @@ class Spaceship(Sprite):
             # turn velocity should be clockwise; update ang_vel
             self.angle_vel = -5
 
-    def shoot(self):
-        pass
+    # missiles are fired every config.MISSILE_RELOAD ticks while firing
+    def shoot(self, firing = True):
+        self.firing = firing
+
+    def fire(self):
+        forward = angle_to_vector(self.angle)
+        pos = [self.pos[i] + forward[i] * self.radius for i in range(2)]
+        vel = [self.vel[i] + forward[i] * config.MISSILE_SPEED for i in range(2)]
+        missile_buffer.spawn(pos, vel)
 
     def update(self):
         """change ship's position based on rotate and accelerate functions"""
+        self.prev_pos.update(self.pos)
         self.angle = (self.angle + self.angle_vel) % 360
+        # the second frame of the ship sheet shows the engines firing
+        if self.frames:
+            self.orig_image = self.frames[1 if self.thrust else 0]
         self.rotate()
 
+        if self.reload:
+            self.reload -= 1
+        if self.firing and not self.reload and missile_buffer is not None:
+            self.fire()
+            self.reload = config.MISSILE_RELOAD
+
         vector = angle_to_vector(self.angle)
-        print("vector: ", vector, "Angle:", self.angle, "Ang Vel:", self.angle_vel)
         friction = 0.995
         # accelerate in direction of ship if thrusters engaged
         if self.thrust:
@@ -430,35 +773,11 @@ class Spaceship(Sprite):
                 self.vel[i] += vector[i] * 0.08
         # update position based on velocity
         for i in range(2):
-            self.pos[i] = (self.pos[i] + self.vel[i]) % (config.SCREENSIZE[i] + self.radius)
+            self.pos[i] = (self.pos[i] + self.vel[i]) % config.WORLDSIZE[i]
             self.vel[i] *= friction # coefficient of friction
 
 
         '''
-        ###############################################
-
-        # check x position out of bounds for smooth screen wrapping
-        if self.pos[0] + self.radius > WIDTH:
-            self.ghostx = True
-            self.ghost_pos[0] = self.pos[0] - WIDTH
-        elif self.pos[0] - self.radius < 0:
-            self.ghostx = True
-            self.ghost_pos[0] = self.pos[0] + WIDTH
-        else:
-            self.ghostx = False
-            self.ghost_pos[0] = self.pos[0]
-
-        # check y position out of bounds for smooth screen wrapping
-        if self.pos[1] + self.radius > HEIGHT:
-            self.ghosty = True
-            self.ghost_pos[1] = self.pos[1] - HEIGHT
-        elif self.pos[1] - self.radius < 0:
-            self.ghosty = True
-            self.ghost_pos[1] = self.pos[1] + HEIGHT
-        else:
-            self.ghosty = False
-            self.ghost_pos[1] = self.pos[1]
-
         ##################### my original bit below ################
 
         # update angle
@@ -480,25 +799,107 @@ class Spaceship(Sprite):
 
         '''
 
-    def draw(self):
-        screen.blit(self.image, self.rect)
+    def draw(self, alpha = None):
+        return screen.blit(*self.get_blit(alpha))
 
 
-# load game resources (graphics)
+# per-type sprite pools
+asteroid_pool = SpritePool(Asteroid)
+explosion_pool = SpritePool(Sprite)
+
+# allocation counters for every pool
+def pool_stats():
+    return {'asteroid': asteroid_pool.get_stats(), 'explosion': explosion_pool.get_stats()}
+
+# game resources; image_info describes each image, the surfaces themselves
+# need a display and are loaded by init()
 nebula_info = ImageInfo([400, 300], [800, 600])
-nebula_image = load_image("nebula_blue.png")
 debris_info = ImageInfo([320, 240], [640, 480])
-debris_image = load_image("debris_blend.png")
-ship_info = ImageInfo([45, 45], [90, 90], 35)
-ship_image = load_image("ship.png")
+ship_info = ImageInfo([45, 45], [90, 90], 35, None, 2)
 asteroid_info = ImageInfo([45, 45], [90, 90], 40)
-asteroid_image = load_image("asteroid_blend.png")
+explosion_info = ImageInfo([64, 64], [128, 128], 17, 24, 24, True)
+missile_info = ImageInfo([5, 5], [10, 10], 3, 50)
+asteroid_field = None
+missile_buffer = None
+
+# placeholder explosion sheet until one is added to gfx/; each frame is a
+# larger, fainter fireball
+def make_explosion_sheet(info):
+    width, height = info.get_size()
+    frames = info.get_frames()
+    sheet = pygame.Surface((width * frames, height), SRCALPHA)
+    for frame in range(frames):
+        progress = (frame + 1) / frames
+        centre = (width * frame + width // 2, height // 2)
+        color = (255, 160, 40, int(200 * (1 - progress)) + 40)
+        pygame.draw.circle(sheet, color, centre, max(1, int(width / 2 * progress)))
+    return sheet.convert_alpha()
+
+# missiles are drawn as a small glowing dot
+def make_missile_image(info):
+    image = pygame.Surface(info.get_size(), SRCALPHA)
+    centre = info.get_center()
+    pygame.draw.circle(image, (255, 200, 120, 120), centre, info.get_radius() + 2)
+    pygame.draw.circle(image, (255, 255, 220), centre, info.get_radius())
+    return image.convert_alpha()
+
+# game images by name, each loaded the first time it is used; see get_image
+images = {}
+
+# return one of the game images: 'ship', 'asteroid', 'explosion' or
+# 'background' (a list of (image, rate) layers). Loaded on first use, so
+# startup does not pay for images that are not drawn yet
+def get_image(name):
+    image = images.get(name)
+    if image is not None:
+        return image
+    if name == 'background':
+        image = [(load_image(filename), rate) for filename, rate in config.BACKGROUND_LAYERS]
+    elif name in ('ship', 'asteroid'):
+        ship = load_image("double_ship.png")
+        asteroid = load_image("asteroid_blend.png")
+        # packed sprites share one surface, so they are loaded together
+        if config.PACK_SPRITES:
+            ship, asteroid = atlas.pack([ship, asteroid])
+        # cut the animated sheets into frames now rather than while drawing
+        atlas.frames(ship, ship_info)
+        images['ship'], images['asteroid'] = ship, asteroid
+        image = images[name]
+    elif name == 'explosion':
+        if (bundle is not None and "explosion_alpha.png" in bundle) or os.path.exists(os.path.join('gfx/', "explosion_alpha.png")):
+            image = load_image("explosion_alpha.png")
+        else:
+            image = make_explosion_sheet(explosion_info)
+        atlas.frames(image, explosion_info)
+    else:
+        raise KeyError(name)
+    images[name] = image
+    return image
+
+# load game resources; images are left to get_image
+def load_resources():
+    global explosion_sound, asteroid_field
+    global missile_image, missile_buffer, missile_group
+    explosion_sound = None
+    missile_image = make_missile_image(missile_info)
+
+    # the widest a rotated ship or asteroid gets is its diagonal
+    edge_band.margin = max(math.hypot(*info.get_size()) / 2 for info in (ship_info, asteroid_info))
+    camera.margin = edge_band.margin + SLACK
+
+    if config.NUMPY_PHYSICS:
+        asteroid_field = AsteroidField(rotation_cache, screen, camera)
+    # without numpy the ship cannot fire
+    try:
+        missile_buffer = MissileBuffer(missile_image, missile_info, screen, camera)
+        missile_group = missile_buffer
+    except ImportError:
+        missile_buffer = None
+    if config.ROTATION_PREWARM:
+        rotation_cache.prewarm(get_image('ship'))
+        rotation_cache.prewarm(get_image('asteroid'))
 
 ''' TBC - temporarily halting loading assets
-missile_info = ImageInfo([5,5], [10, 10], 3, 50)
-missile_image = load_image("shot1.png")
-explosion_info = ImageInfo([64, 64], [128, 128], 17, 24, True)
-explosion_image = load_image("explosion.png")
 background_info = ImageInfo([400, 300], [800, 600])
 background_image = pygame.image.load("../data/img/background1.jpg")
 # load game resources (audio)
@@ -506,41 +907,460 @@ explosion_sound = load_sound("explosion.ogg")
 soundtrack = load_sound("soundtrack.ogg")
 '''
 
+# move the sprite asteroids. In a world larger than the screen, asteroids
+# further than config.SLEEP_DISTANCE from the ship sleep: they are left alone
+# for config.SLEEP_TICKS ticks and then moved that many ticks at once
+def update_asteroids(player):
+    if not camera.scrolling:
+        for asteroid in enemy_group:
+            asteroid.update()
+        return
+    # last tick's grid is close enough to tell which asteroids are near
+    awake = set(enemy_index.query(player.get_position(), config.SLEEP_DISTANCE))
+    for asteroid in enemy_group:
+        steps = tick_count - asteroid.tick
+        if steps >= config.SLEEP_TICKS or (steps and asteroid in awake):
+            asteroid.update(steps)
+
+# advance the game by one tick; shared by main() and the headless runner.
+# Returns True if the player was hit this tick
+def update_world(player):
+    global tick_count, visible_enemies
+    tick_count += 1
+    enemy_spawner(player.get_position(), player.get_radius())
+    profiler.mark('spawn')
+
+    player.update()
+    camera.follow(player.get_position())
+    if asteroid_field is not None:
+        # release asteroids destroyed last frame, then move the whole field
+        asteroid_field.prune()
+        enemy_group.difference_update(asteroid_field.step())
+    else:
+        update_asteroids(player)
+    if missile_buffer is not None:
+        missile_buffer.step()
+    profiler.mark('sprite_update')
+    if rotation_cache.timed:
+        profiler.carve('sprite_update', 'rotation', rotation_cache.take_elapsed())
+
+    # collisions; the broadphase grid is rebuilt once per tick and the
+    # sprites crossing a screen edge found from its border cells
+    enemy_index.rebuild(enemy_group)
+    edge_band.find(player, enemy_index, missile_buffer, enemy_group)
+    hit = group_collide(enemy_group, player, enemy_index)
+    if hit:
+        player.lives -= 1
+    group_group_collide(enemy_group, missile_group, enemy_index)
+    process_sprite_group(explosion_group, draw = False)
+    edge_band.scan(explosion_group)
+    narrowphase.end_tick()
+    profiler.mark('collision')
+
+    # only the asteroids on screen are rotated and drawn
+    visible_enemies = camera.cull(enemy_index, enemy_group)
+    if asteroid_field is not None:
+        for asteroid in visible_enemies:
+            asteroid.update()
+    camera.end_tick()
+    return hit
+
+# order-independent hash of the simulation state after a tick; replays
+# compare it tick by tick to catch divergence
+def state_hash(player):
+    state = [tuple(player.get_position()), tuple(player.vel), player.angle, player.lives,
+             player.firing, player.reload, score, difficulty, len(explosion_group)]
+    state += sorted(tuple(sprite.get_position()) for sprite in enemy_group)
+    state += sorted(tuple(missile.get_position()) for missile in missile_group)
+    return zlib.crc32(repr(state).encode('ascii'))
+
+# entity ids of some slots of a field or buffer; slots without one yet are
+# given the next free ids
+def slot_ids(ident, slots):
+    global next_entity_id
+    ids = ident[slots]
+    new = ids == 0
+    count = int(new.sum())
+    if count:
+        ids[new] = range(next_entity_id, next_entity_id + count)
+        ident[slots[new]] = ids[new]
+        next_entity_id += count
+    return ids
+
+# the whole game state as a snapshot.GameState; entities keep their id from
+# one capture to the next so deltas can match them up. Asteroids in the
+# field and missiles keep their ids in an array beside their state and are
+# captured with array operations; the ids of sprites are kept in entity_ids
+def capture_state(player):
+    global entity_ids, next_entity_id
+    parts = []
+    sprites = [(snapshot.EXPLOSION, sprite) for sprite in explosion_group]
+    if asteroid_field is not None:
+        field = asteroid_field
+        slots = field.live_slots()
+        parts.append((slot_ids(field.ident, slots),
+                      snapshot.entity_array(snapshot.ASTEROID, field.age[slots], field.pos[slots], field.vel[slots],
+                                            field.angle[slots], field.angle_vel[slots])))
+    else:
+        sprites += [(snapshot.ASTEROID, sprite) for sprite in enemy_group]
+    if missile_buffer is not None:
+        buffer = missile_buffer
+        slots = buffer.live_slots()
+        parts.append((slot_ids(buffer.ident, slots),
+                      snapshot.entity_array(snapshot.MISSILE, buffer.tick - buffer.birth[slots],
+                                            buffer.pos[slots], buffer.vel[slots])))
+    else:
+        sprites += [(snapshot.MISSILE, sprite) for sprite in missile_group]
+    ids = {}
+    records = []
+    for kind, sprite in sprites:
+        ident = entity_ids.get(sprite)
+        if ident is None:
+            ident = next_entity_id
+            next_entity_id += 1
+        ids[sprite] = ident
+        # only a scrolling world lets asteroids sleep, see update_asteroids
+        lag = tick_count - sprite.tick if kind == snapshot.ASTEROID and camera.scrolling else 0
+        records.append((ident, kind, sprite.age, tuple(sprite.pos), tuple(sprite.vel), sprite.angle, sprite.angle_vel, lag))
+    entity_ids = ids
+    parts.append(snapshot.record_arrays(records))
+    ship = (player.pos[0], player.pos[1], player.vel[0], player.vel[1], player.angle, player.angle_vel,
+            player.thrust, player.firing, player.turn, player.lives, player.score, player.reload)
+    rng = snapshot.pack_random(random.getstate())
+    if spawn_planner is not None:
+        rng += spawn_planner.get_state()
+    return snapshot.join_state(tick_count, score, difficulty, ship, parts, rng)
+
+# replace the game state with a captured one
+def restore_state(state, player):
+    global score, difficulty, tick_count, entity_ids, next_entity_id
+    clear_arena()
+    entity_ids = {}
+    # ids handed out later must not clash with the restored ones
+    if len(state.ids):
+        next_entity_id = max(next_entity_id, int(state.ids.max()) + 1)
+    score = state.score
+    # a new game starts difficulty at the int 0 and the ship turns in whole
+    # degrees; types are kept as they were so state_hash matches
+    difficulty = state.difficulty or 0
+    tick_count = state.tick
+    (x, y, vx, vy, angle, angle_vel, player.thrust, player.firing, player.turn,
+     player.lives, player.score, player.reload) = state.ship
+    player.angle = int(angle) if angle.is_integer() else angle
+    player.angle_vel = int(angle_vel) if angle_vel.is_integer() else angle_vel
+    player.pos.update(x, y)
+    player.prev_pos.update(x, y)
+    player.vel[0] = vx
+    player.vel[1] = vy
+    player.rotate()
+
+    # missiles go back into the ring oldest first, so expiry stays at the tail
+    order = (-state.entities['age'].astype('i8')).argsort(kind = 'stable')
+    entities = state.entities[order]
+    ids = state.ids[order]
+    for ident, kind, age, pos, vel, angle, angle_vel, lag in zip(ids.tolist(), entities['kind'].tolist(), entities['age'].tolist(),
+                                                               entities['pos'].tolist(), entities['vel'].tolist(),
+                                                               entities['angle'].tolist(), entities['angle_vel'].tolist(),
+                                                               entities['lag'].tolist()):
+        if kind == snapshot.ASTEROID:
+            sprite = new_asteroid(pos, vel, angle, angle_vel)
+            enemy_group.add(sprite)
+        elif kind == snapshot.EXPLOSION:
+            sprite = explosion_pool.acquire(pos, vel, angle, angle_vel, get_image('explosion'), explosion_info)
+            explosion_group.add(sprite)
+        elif kind == snapshot.MISSILE and missile_buffer is not None:
+            missile_buffer.ident[missile_buffer.spawn(pos, vel, age).index] = ident
+            continue
+        else:
+            continue
+        if sprite.__class__ is AsteroidHandle:
+            asteroid_field.age[sprite.index] = age
+            asteroid_field.ident[sprite.index] = ident
+        else:
+            sprite.age = age
+            # a sleeping asteroid wakes on the same tick it would have
+            sprite.tick = tick_count - lag
+            if sprite.animated:
+                sprite.animate()
+            sprite.rotate()
+            entity_ids[sprite] = ident
+    # the next tick tells sleeping asteroids from awake ones by this grid
+    enemy_index.rebuild(enemy_group)
+
+    random.setstate(snapshot.unpack_random(state.rng))
+    if spawn_planner is not None and len(state.rng) > snapshot.RANDOM.size:
+        spawn_planner.set_state(state.rng[snapshot.RANDOM.size:])
+    # restored sprites are new objects, so the next frame has to be a key frame
+    if encoder is not None:
+        encoder.reset()
+
+# encode this tick for the rewind buffer and spectators
+def publish_snapshot(player):
+    frame = encoder.encode(capture_state(player))
+    if rewind_buffer is not None:
+        rewind_buffer.push(frame)
+    if spectator is not None:
+        spectator.publish(frame)
+
+def save_game(player):
+    snapshot.save(config.SAVE_FILE, capture_state(player))
+    print('game saved to', config.SAVE_FILE)
+
+def load_game(player):
+    if os.path.exists(config.SAVE_FILE):
+        try:
+            state = snapshot.load(config.SAVE_FILE)
+        except ValueError as message:
+            print('cannot load', config.SAVE_FILE + ':', message)
+            return
+        restore_state(state, player)
+
+def rewind_game(player):
+    if rewind_buffer is not None:
+        state = rewind_buffer.rewind(int(config.REWIND_STEP * config.SIM_RATE))
+        if state is not None:
+            restore_state(state, player)
+
+# draw the sprites for the current tick along with whatever else has been
+# queued this frame; returns the rects drawn outside the background. alpha
+# interpolates between the last two ticks, see Sprite.get_blit
+def draw_world(player, alpha = None):
+    # the camera follows the ship as drawn, so it stays in the centre
+    if alpha is not None:
+        camera.follow(interpolate(player.prev_pos, player.pos, alpha))
+    render_queue.add(*player.get_blit(alpha), layer = SPRITES)
+    render_queue.extend([asteroid.get_blit(alpha) for asteroid in visible_enemies], ASTEROIDS)
+    render_queue.extend([explosion.get_blit(alpha) for explosion in explosion_group
+                         if camera.sees(explosion.get_position())], EXPLOSIONS)
+    if missile_buffer is not None:
+        render_queue.extend(missile_buffer.get_blits(alpha), MISSILES)
+    # wrapped copies of the sprites crossing an edge, on their sprites'
+    # layers; a scrolling camera already draws the world across its seam.
+    # Ghost rects are taken after get_blit() has moved the sprites' rects
+    if not camera.scrolling:
+        render_queue.extend(edge_band.get_blits(), SPRITES)
+        render_queue.extend(edge_band.get_blits(enemy_group), ASTEROIDS)
+        render_queue.extend(edge_band.get_blits(explosion_group), EXPLOSIONS)
+    return render_queue.flush()
+
+# draw the frame and push it to the display
+def draw_frame(environment, player, alpha = None):
+    full = renderer is None or renderer.full_update_needed(environment.moved)
+    if full:
+        environment.draw(player)
+    else:
+        # erase last frame's sprites and HUD, then redraw them
+        for rect in renderer.get_previous():
+            environment.draw_area(rect)
+        environment.draw_hud(player)
+    profiler.mark('background_draw')
+
+    rects = draw_world(player, alpha)
+    if profiler.overlay:
+        rects.append(profiler.draw(screen, (10, config.SCREENSIZE[1] - 110)))
+    profiler.mark('draw')
+
+    if renderer is None:
+        pygame.display.update()
+    else:
+        renderer.present(rects, full)
+    profiler.mark('display')
+
+# snapshot of what the renderer needs, taken on the simulation thread
+def take_snapshot(tick, environment, player):
+    ship = [(player.image, camera.place(player.rect).copy())]
+    enemies = [(sprite.image, camera.place(sprite.rect).copy()) for sprite in visible_enemies]
+    explosions = [(sprite.image, camera.place(sprite.rect).copy()) for sprite in explosion_group
+                  if camera.sees(sprite.get_position())]
+    missiles = []
+    if missile_buffer is not None:
+        missiles = [(missile_image, missile_image.get_rect(center = camera.to_screen(missile.get_position())))
+                    for missile in missile_buffer if camera.sees(missile.get_position())]
+    if not camera.scrolling:
+        ship += edge_band.get_blits()
+        enemies += edge_band.get_blits(enemy_group)
+        explosions += edge_band.get_blits(explosion_group)
+    sprites = ((SPRITES, tuple(ship)), (ASTEROIDS, tuple(enemies)),
+               (EXPLOSIONS, tuple(explosions)), (MISSILES, tuple(missiles)))
+    return Snapshot(tick, time.perf_counter(), sprites, environment.layers.get_offsets(),
+                    player.get_lives(), score)
+
+def draw_snapshot(view, snapshot):
+    view.layers.set_offsets(snapshot.offsets)
+    view.draw_scenery()
+    hud.set('lives', snapshot.lives)
+    hud.set('score', snapshot.score)
+    if config.SHOW_FPS:
+        hud.set('fps', int(clock.get_fps()))
+    render_queue.extend(hud.get_blits(), HUD)
+    for layer, blits in snapshot.sprites:
+        render_queue.extend(list(blits), layer)
+    render_queue.flush()
+
+# game loop with the simulation on its own thread; the main thread only
+# handles events and draws the newest published snapshot
+def run_threaded(player):
+    environment = Background()      # stepped by the simulation thread
+    view = Background()             # drawn by the main thread
+    buffer = TripleBuffer()
+    stats = PipelineStats()
+    tick = 0
+
+    def step(events):
+        nonlocal tick
+        for event in events:
+            if event.type == KEYDOWN:
+                key_down(event, player)
+            if event.type == KEYUP:
+                key_up(event, player)
+        update_world(player)
+        environment.update()
+        tick += 1
+
+    simulation = SimulationThread(step, lambda: take_snapshot(tick, environment, player),
+                                  config.SIM_RATE, buffer, stats)
+    simulation.start()
+    snapshot = None
+
+    while True:
+        simulation.check()
+        for event in pygame.event.get():
+            if event.type in (KEYDOWN, KEYUP):
+                # escape is handled here; the profiler is single-threaded only
+                if event.key == K_ESCAPE:
+                    simulation.stop()
+                    print('pipeline:', stats.get_summary(), 'published:', buffer.published, 'dropped:', buffer.dropped)
+                    exit_game()
+                elif event.key != K_F3:
+                    simulation.events.put(event)
+
+        latest = buffer.latest()
+        if latest is not None:
+            snapshot = latest
+        if snapshot is not None:
+            start = time.perf_counter()
+            draw_snapshot(view, snapshot)
+            pygame.display.update()
+            end = time.perf_counter()
+            stats.render_busy.append((start, end))
+            if latest is not None:
+                stats.latency.append(end - latest.published)
+        clock.tick(config.FPS)
+
+# settings the threaded pipeline does not support; see run_threaded
+THREADED_UNSUPPORTED = ('RECORD_FILE', 'GOVERNOR', 'INPUT_LATENCY', 'LOW_LATENCY', 'REWIND_SECONDS', 'SPECTATOR_PORT')
 
 # main game loop - one loop to rule them all
 def main():
+    global recording, input_latency, governor, encoder, rewind_buffer, spectator
+    if config.THREADED:
+        unsupported = [name for name in THREADED_UNSUPPORTED if getattr(config, name)]
+        if unsupported:
+            raise SystemExit('config.THREADED cannot be combined with ' +
+                             ', '.join('config.' + name for name in unsupported))
+    init()
+
     # start music
     if config.SOUND == True:
         soundtrack.play(-1)
 
-    environment = Background()
-    player = Spaceship([100, 100], [0, 0], 0, 0, ship_image, ship_info)
-
-    while True:
-        # event handlers
-        for event in pygame.event.get():
-            if event.type == KEYDOWN:
-                key_down(event, player)
-            if event.type == KEYUP:
-                key_up(event, player)
+    # a recorded session starts from a known seed
+    if config.RECORD_FILE:
+        recording = Recording(random.randrange(2 ** 32))
+        random.seed(recording.seed)
+
+    if config.INPUT_LATENCY:
+        input_latency = InputLatency()
+    if config.GOVERNOR:
+        governor = Governor(apply_quality)
+    if config.REWIND_SECONDS or config.SPECTATOR_PORT:
+        encoder = snapshot.Encoder()
+        if config.REWIND_SECONDS:
+            rewind_buffer = snapshot.RewindBuffer(int(config.REWIND_SECONDS * config.SIM_RATE))
+        if config.SPECTATOR_PORT:
+            spectator = snapshot.SpectatorServer(config.SPECTATOR_PORT)
 
-        # write game logic here
-        enemy_spawner(player.get_position(), player.get_radius())
+    environment = Background()
+    player = new_game()
+    if config.THREADED:
+        run_threaded(player)
 
-        # draw the game arena
-        environment.update()
-        environment.draw(player)
+    # the simulation advances in fixed ticks of config.SIM_RATE per second
+    # whatever the frame rate; rendering interpolates between the last two
+    tick_length = 1.0 / config.SIM_RATE
+    frame_length = 1.0 / config.FPS
+    accumulator = tick_length
+    previous = time.perf_counter()
 
-        # sprite draw code here
-        player.update()
-        player.draw()
-        for asteroid in enemy_group:
-            asteroid.update()
-            asteroid.draw()
+    while True:
+        profiler.begin_frame()
+        now = time.perf_counter()
+        accumulator += now - previous
+        previous = now
 
-        # display whatever is drawn
-        pygame.display.update()
-        clock.tick(config.FPS)
+        # event handlers
+        events = poll_events()
+        handle_events(player, events)
+        profiler.mark('events')
+
+        # low latency mode runs the tick that applies new key input straight
+        # away rather than when it falls due. The tick is borrowed from the
+        # accumulator, which may go up to two ticks negative, so the
+        # simulation still runs at config.SIM_RATE over time
+        early = (config.LOW_LATENCY and accumulator > -tick_length and
+                 any(event.type in (KEYDOWN, KEYUP) for event in events))
+
+        # game logic; run as many ticks as have elapsed, up to the catch-up
+        # limit, after which the game slows down rather than stalling
+        ticks = 0
+        while accumulator >= tick_length or early:
+            early = False
+            if ticks == config.MAX_CATCHUP_TICKS:
+                accumulator = 0.0
+                break
+            update_world(player)
+            if input_latency is not None:
+                input_latency.tick()
+            if recording is not None:
+                recording.add_tick(state_hash(player))
+            if encoder is not None:
+                publish_snapshot(player)
+            environment.update()
+            profiler.mark('background_update')
+            accumulator -= tick_length
+            ticks += 1
+
+        # draw the game arena and display whatever is drawn; interpolation
+        # shows a state up to a tick old, so low latency mode skips it
+        if config.INTERPOLATE and not config.LOW_LATENCY:
+            draw_frame(environment, player, accumulator / tick_length)
+        else:
+            draw_frame(environment, player)
+        if input_latency is not None:
+            input_latency.flipped()
+        if governor is not None:
+            governor.frame(time.perf_counter() - now)
+
+        # low latency mode sleeps until the next tick is due (but at least a
+        # frame) with a short spin at the end instead of clock.tick's coarser
+        # delay, and wakes as soon as a key event arrives; latency tracking
+        # waits in slices so arrivals are stamped
+        if config.LOW_LATENCY:
+            wait_until(now + max(frame_length, tick_length - accumulator),
+                       input_latency.poll if input_latency is not None else pygame.event.pump,
+                       wake = key_waiting)
+            clock.tick()
+        elif input_latency is not None:
+            input_latency.wait(now + frame_length)
+            clock.tick()
+        else:
+            clock.tick(config.FPS)
+        profiler.mark('tick')
+        profiler.end_frame()
 
 if __name__ == '__main__':
+    if '--self-test' in sys.argv:
+        print('pairs found:', self_test())
+        print('self test passed')
+        sys.exit(0)
     main()
@@ -0,0 +1,51 @@
+#! python3
+'''
+Description         :   Sprite sheet atlas. Animated sheets are cut into frame
+                        surfaces once at load time and small sprites can be
+                        packed into a single shared surface.
+'''
+
+import pygame
+
+# Atlas class; sliced sheets are cached by source image
+class Atlas:
+    def __init__(self, max_width = 1024):
+        self.sheets = {}
+        self.max_width = max_width
+        self.surface = None
+
+    # frames of an animated sheet laid out left to right, info.get_size() each
+    def frames(self, image, info):
+        frames = self.sheets.get(image)
+        if frames is None:
+            width, height = info.get_size()
+            count = max(1, min(info.get_frames(), image.get_width() // width))
+            frames = [image.subsurface((width * index, 0, width, height)) for index in range(count)]
+            self.sheets[image] = frames
+        return frames
+
+    # pack surfaces into rows of a single surface; returns subsurfaces of the
+    # packed surface in the same order as the surfaces passed in
+    def pack(self, surfaces):
+        order = sorted(range(len(surfaces)), key = lambda index: -surfaces[index].get_height())
+        places = [None] * len(surfaces)
+        x = y = row_height = width = 0
+        for index in order:
+            w, h = surfaces[index].get_size()
+            if x + w > self.max_width and x > 0:
+                x = 0
+                y += row_height
+                row_height = 0
+            places[index] = pygame.Rect(x, y, w, h)
+            x += w
+            width = max(width, x)
+            row_height = max(row_height, h)
+
+        self.surface = pygame.Surface((width, y + row_height), pygame.SRCALPHA).convert_alpha()
+        self.surface.fill((0, 0, 0, 0))
+        # max blending onto the cleared surface copies pixels and alpha as-is
+        for surface, place in zip(surfaces, places):
+            self.surface.blit(surface, place, special_flags = pygame.BLEND_RGBA_MAX)
+        # sliced sheets pointing at the old surfaces are dropped
+        self.sheets.clear()
+        return [self.surface.subsurface(place) for place in places]
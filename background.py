@@ -0,0 +1,176 @@
+#! python3
+'''
+Description         :   Parallax background layers. Runs of static layers are
+                        composited once into a single display-format surface
+                        (opaque at the bottom of the stack). Scrolling layers
+                        repeat every screen size; an opaque scrolling layer
+                        keeps a screen buffer that is moved with scroll() and
+                        only has the exposed strip redrawn, a transparent one
+                        is blitted as the two (or four) pieces that cover the
+                        screen.
+'''
+
+import pygame
+from pygame.locals import *
+
+# Static layer class; one or more layers flattened into one surface
+class StaticLayer:
+    def __init__(self, images, size, opaque):
+        if opaque:
+            self.surface = pygame.Surface(size).convert()
+            self.surface.fill((0, 0, 0))
+            for image in images:
+                self.surface.blit(image, (0, 0))
+        else:
+            # the first image is copied rather than blended so its edges are
+            # not darkened against the transparent surface
+            self.surface = pygame.Surface(size, SRCALPHA).convert_alpha()
+            self.surface.fill((0, 0, 0, 0))
+            self.surface.blit(images[0], (0, 0), special_flags = BLEND_RGBA_MAX)
+            for image in images[1:]:
+                self.surface.blit(image, (0, 0))
+
+    def update(self):
+        return False
+
+    def get_blits(self):
+        return [(self.surface, self.surface.get_rect())]
+
+    def draw(self, surface):
+        surface.blit(self.surface, (0, 0))
+
+# Scroll layer class; the image sits at the top left of a screen sized tile
+# that repeats in both directions, so at most four pieces cover the screen
+class ScrollLayer:
+    def __init__(self, image, rate, size, opaque):
+        self.rate = list(rate)
+        self.size = size
+        self.offset = [0.0, 0.0]
+        self.opaque = opaque
+        if opaque:
+            self.tile = pygame.Surface(size).convert()
+            self.tile.fill((0, 0, 0))
+            self.tile.blit(image, (0, 0))
+            self.view = self.tile.copy()
+        else:
+            # only the visible part of the image is blitted; the rest of the
+            # tile is empty
+            self.tile_rect = image.get_bounding_rect()
+            self.tile = image.subsurface(self.tile_rect).convert_alpha()
+            self.view = None
+        self.view_offset = (0, 0)
+        self.scrolls = 0
+
+    def update(self):
+        self.set_offset((self.offset[0] + self.rate[0], self.offset[1] + self.rate[1]))
+        return self.rate[0] != 0 or self.rate[1] != 0
+
+    def set_offset(self, offset):
+        self.offset = [offset[0] % self.size[0], offset[1] % self.size[1]]
+
+    def get_offset(self):
+        return tuple(self.offset)
+
+    # the tile pieces that cover the screen at the current offset
+    def tile_blits(self):
+        x, y = int(self.offset[0]), int(self.offset[1])
+        if not self.opaque:
+            x += self.tile_rect.x
+            y += self.tile_rect.y
+        width, height = self.tile.get_size()
+        blits = []
+        for left in (x, x - self.size[0]):
+            if left < self.size[0] and left + width > 0:
+                for top in (y, y - self.size[1]):
+                    if top < self.size[1] and top + height > 0:
+                        blits.append((self.tile, pygame.Rect(left, top, width, height)))
+        return blits
+
+    def draw_tiles(self, surface):
+        surface.blits(self.tile_blits(), doreturn = False)
+
+    # bring the view buffer up to the current offset; a small move shifts
+    # the buffer and redraws only the exposed strips
+    def refresh_view(self):
+        x, y = int(self.offset[0]), int(self.offset[1])
+        dx = (x - self.view_offset[0] + self.size[0] // 2) % self.size[0] - self.size[0] // 2
+        dy = (y - self.view_offset[1] + self.size[1] // 2) % self.size[1] - self.size[1] // 2
+        if dx == 0 and dy == 0:
+            return
+        width, height = self.size
+        self.view.scroll(dx, dy)
+        strips = []
+        if dx:
+            strips.append(pygame.Rect(0 if dx > 0 else width + dx, 0, abs(dx), height))
+        if dy:
+            strips.append(pygame.Rect(0, 0 if dy > 0 else height + dy, width, abs(dy)))
+        for strip in strips:
+            self.view.set_clip(strip)
+            self.draw_tiles(self.view)
+        self.view.set_clip(None)
+        self.view_offset = (x, y)
+        self.scrolls += 1
+
+    def get_blits(self):
+        if self.opaque:
+            self.refresh_view()
+            return [(self.view, self.view.get_rect())]
+        return self.tile_blits()
+
+    def draw(self, surface):
+        surface.blits(self.get_blits(), doreturn = False)
+
+# Layer stack class; layers is a list of (image, scroll rate) pairs, bottom first
+class LayerStack:
+    def __init__(self, layers, size):
+        self.size = tuple(size)
+        self.layers = []
+        self.scrolling = []
+        static = []
+        for image, rate in layers:
+            if rate[0] == 0 and rate[1] == 0:
+                static.append(image)
+                continue
+            if static:
+                self.layers.append(StaticLayer(static, self.size, not self.layers))
+                static = []
+            layer = ScrollLayer(image, rate, self.size, not self.layers)
+            self.layers.append(layer)
+            self.scrolling.append(layer)
+        if static:
+            self.layers.append(StaticLayer(static, self.size, not self.layers))
+
+    # advance every scrolling layer; returns True if anything moved
+    def update(self):
+        moved = False
+        for layer in self.scrolling:
+            moved = layer.update() or moved
+        return moved
+
+    def get_offsets(self):
+        return tuple(layer.get_offset() for layer in self.scrolling)
+
+    def set_offsets(self, offsets):
+        for layer, offset in zip(self.scrolling, offsets):
+            layer.set_offset(offset)
+
+    # (surface, rect) pairs for the bottom count layers, for a RenderQueue
+    def get_blits(self, count = None):
+        blits = []
+        for layer in self.layers[:count]:
+            blits += layer.get_blits()
+        return blits
+
+    # count limits drawing to the bottom count layers
+    def draw(self, surface, count = None):
+        surface.blits(self.get_blits(count), doreturn = False)
+
+    # redraw the layers under a rect only
+    def draw_area(self, surface, rect, count = None):
+        surface.set_clip(rect)
+        self.draw(surface, count)
+        surface.set_clip(None)
+
+    def get_stats(self):
+        return {'layers': len(self.layers), 'scrolling': len(self.scrolling),
+                'scrolls': sum(layer.scrolls for layer in self.scrolling)}
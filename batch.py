@@ -0,0 +1,136 @@
+#! python3
+'''
+Description         :   Batch runner for simulated games. Games are fanned out
+                        across a process pool, each with its own seed, pilot and
+                        config overrides; results stream back as they finish
+                        and are summarised per parameter set. Every parameter
+                        set gets a pool of fresh workers with the overrides
+                        applied before the game is imported, so settings read
+                        at import or init() time take effect too.
+Usage               :   python batch.py [--games 100] [--ticks 3000] [--workers N]
+                                        [--pilot idle|random|spinner]
+                                        [--set NAME=VALUE[,VALUE...]] ...
+'''
+
+import os
+import sys
+import ast
+import time
+import random
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import config
+
+# Random pilot class; presses and releases keys at random using its own RNG
+# so the game's spawn sequence is unaffected
+class RandomPilot:
+    def __init__(self, seed, change_rate = 0.05):
+        self.rng = random.Random(seed)
+        self.change_rate = change_rate
+
+    def __call__(self, tick, player):
+        if self.rng.random() < self.change_rate:
+            player.set_thrust(self.rng.random() < 0.5)
+            player.turn = 0
+            player.set_turn(self.rng.choice([-1, 0, 1]))
+            player.shoot(self.rng.random() < 0.5)
+
+# scripted pilot; full thrust in a constant turn, firing all the while
+def spinner(tick, player):
+    if tick == 0:
+        player.set_thrust(True)
+        player.set_turn(1)
+        player.shoot()
+
+def make_pilot(name, seed):
+    if name == 'random':
+        return RandomPilot(seed)
+    if name == 'spinner':
+        return spinner
+    return None
+
+# worker initializer; the game must not have been imported yet, as module
+# globals and init() read config only once
+def apply_overrides(overrides):
+    if 'asteroids' in sys.modules:
+        raise RuntimeError('config overrides applied after the game was imported')
+    for name, value in overrides.items():
+        setattr(config, name, value)
+
+# run one game in a worker process set up by apply_overrides()
+def run_game(task):
+    import headless
+    seed, overrides, ticks, pilot = task
+    result = headless.run(ticks, seed, make_pilot(pilot, seed), until_dead = True)
+    return {'seed': seed,
+            'overrides': overrides,
+            'score': result['score'],
+            'survival_ticks': result['survival_ticks'],
+            'collisions': result['ship_collisions'],
+            'tick_us': result['elapsed'] / max(1, result['ticks']) * 1e6}
+
+# parse NAME=VALUE[,VALUE...] settings into every combination of overrides
+def parameter_sets(settings):
+    names = []
+    choices = []
+    for setting in settings:
+        name, values = setting.split('=', 1)
+        if not hasattr(config, name):
+            raise SystemExit('unknown config setting: ' + name)
+        names.append(name)
+        choices.append([ast.literal_eval(value) for value in values.split(',')])
+    return [dict(zip(names, combination)) for combination in itertools.product(*choices)]
+
+def summarise(results):
+    print()
+    print('%-40s %6s %9s %9s %10s %11s %9s' % ('parameters', 'games', 'score', 'max', 'survival', 'collisions', 'us/tick'))
+    for key, games in sorted(results.items()):
+        count = len(games)
+        print('%-40s %6d %9.2f %9d %10.1f %11.2f %9.1f' % (
+            key or '(defaults)', count,
+            sum(game['score'] for game in games) / count,
+            max(game['score'] for game in games),
+            sum(game['survival_ticks'] for game in games) / count,
+            sum(game['collisions'] for game in games) / count,
+            sum(game['tick_us'] for game in games) / count))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Run many simulated games in parallel')
+    parser.add_argument('--games', type = int, default = 100, help = 'games per parameter set')
+    parser.add_argument('--ticks', type = int, default = 3000, help = 'tick limit per game')
+    parser.add_argument('--workers', type = int, default = os.cpu_count())
+    parser.add_argument('--pilot', default = 'random', choices = ('idle', 'random', 'spinner'))
+    parser.add_argument('--seed', type = int, default = 0, help = 'first game seed')
+    parser.add_argument('--set', action = 'append', default = [], dest = 'settings')
+    parser.add_argument('--quiet', action = 'store_true', help = 'only print the summary')
+    args = parser.parse_args(argv)
+
+    sets = parameter_sets(args.settings)
+    total = len(sets) * args.games
+    done = 0
+    results = {}
+    start = time.perf_counter()
+    # workers are only reused within a parameter set
+    for overrides in sets:
+        tasks = [(args.seed + game, overrides, args.ticks, args.pilot) for game in range(args.games)]
+        with ProcessPoolExecutor(max_workers = args.workers, initializer = apply_overrides,
+                                 initargs = (overrides,)) as executor:
+            futures = [executor.submit(run_game, task) for task in tasks]
+            for future in as_completed(futures):
+                result = future.result()
+                done += 1
+                key = ' '.join('%s=%r' % item for item in sorted(result['overrides'].items()))
+                results.setdefault(key, []).append(result)
+                if not args.quiet:
+                    print('[%d/%d] %s seed=%d score=%d survival=%d collisions=%d' % (
+                        done, total, key or '(defaults)', result['seed'], result['score'],
+                        result['survival_ticks'], result['collisions']))
+    elapsed = time.perf_counter() - start
+
+    summarise(results)
+    print('\n%d games in %.1f s on %d workers (%.1f games/s)' % (total, elapsed, args.workers, total / elapsed))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
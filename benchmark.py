@@ -0,0 +1,221 @@
+#! python3
+'''
+Description         :   Scripted benchmarks for the game loop. Runs the game's
+                        own tick, asteroids.update_world(), and draw code
+                        through fixed scenarios on an offscreen surface and
+                        compares per-stage frame times against a stored
+                        baseline; without a baseline the run fails until one
+                        is written with --update-baseline. --render compares
+                        drawing with the batched render queue against one blit
+                        per sprite instead.
+Usage               :   python benchmark.py [--update-baseline] [--baseline FILE]
+                                            [--threshold 0.25] [scenario ...]
+                        python benchmark.py --render
+'''
+
+import sys
+import json
+import time
+import random
+import argparse
+import pygame
+import config
+import asteroids
+from profiler import FrameProfiler, STAGES as PROFILE_STAGES
+
+BASELINE = 'benchmark_baseline.json'
+
+# name: (asteroids, missiles per frame, spinning asteroids, frames)
+SCENARIOS = {
+    'asteroids_12': (12, 0, False, 600),
+    'asteroids_100': (100, 0, False, 300),
+    'asteroids_1000': (1000, 0, False, 100),
+    'asteroids_10000': (10000, 0, False, 20),
+    'heavy_rotation': (500, 0, True, 200),
+    'collision_storm': (500, 50, True, 200),
+}
+
+STAGES = ('spawn', 'update', 'collide', 'draw', 'frame')
+
+# profiler stages that make up each benchmark stage; the scenario's own
+# top up is charged to spawn
+PROFILER_STAGES = {'spawn': ('spawn',), 'update': ('sprite_update', 'rotation'),
+                   'collide': ('collision',), 'draw': ('draw',)}
+
+# (sprites, frames) for the render queue comparison
+RENDER_COUNTS = ((12, 600), (500, 200), (5000, 40))
+
+def random_position():
+    return [random.randrange(0, config.WORLDSIZE[0]), random.randrange(0, config.WORLDSIZE[1])]
+
+def random_velocity():
+    return [random.random() * config.DIFFICULTY * random.choice([-1, 1]),
+            random.random() * config.DIFFICULTY * random.choice([-1, 1])]
+
+# top up the asteroid field; spinning asteroids force a new rotation every frame
+def populate(count, spin):
+    while len(asteroids.enemy_group) < count:
+        ang_vel = random.uniform(-5, 5) if spin else 0
+        asteroids.enemy_group.add(asteroids.new_asteroid(random_position(), random_velocity(), random.randrange(360), ang_vel))
+
+def fire_missiles(count):
+    for i in range(count):
+        asteroids.missile_buffer.spawn(random_position(), random_velocity())
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+# run one scenario through the game's tick; returns mean and p99
+# milliseconds for every stage. The stages are timed by swapping a profiler
+# of our own in for the game's
+def run_scenario(name, seed = 0):
+    count, missiles, spin, frames = SCENARIOS[name]
+    random.seed(seed)
+    player = asteroids.new_game()
+    asteroids.narrowphase.history.clear()
+    config.MAX_ENEMY_SPRITES = count
+    populate(count, spin)
+    game_profiler, timed = asteroids.profiler, asteroids.rotation_cache.timed
+    profiler = asteroids.profiler = FrameProfiler(frames, enabled = True)
+    asteroids.rotation_cache.timed = True
+
+    try:
+        for frame in range(frames):
+            profiler.begin_frame()
+            populate(count, spin)
+            fire_missiles(missiles)
+            asteroids.update_world(player)
+            asteroids.screen.fill((0, 0, 0))
+            asteroids.draw_world(player)
+            profiler.mark('draw')
+            profiler.end_frame()
+    finally:
+        asteroids.profiler, asteroids.rotation_cache.timed = game_profiler, timed
+
+    columns = dict((stage, i) for i, stage in enumerate(PROFILE_STAGES))
+    timings = dict((stage, []) for stage in STAGES)
+    for sample in profiler.get_frames():
+        for stage, parts in PROFILER_STAGES.items():
+            timings[stage].append(sum(sample[columns[part]] for part in parts) / 1000)
+        timings['frame'].append(sum(sample) / 1000)
+
+    result = {}
+    for stage, samples in timings.items():
+        result[stage] = {'mean': sum(samples) / len(samples) * 1000,
+                         'p99': percentile(samples, 0.99) * 1000}
+    return result, asteroids.narrowphase.get_means()
+
+# (name, batched, sorted) render queue modes for the comparison
+RENDER_MODES = (('per-sprite', False, False), ('batched', True, False), ('sorted', True, True))
+
+# draw and frame times with every blit submitted on its own and with one
+# Surface.blits() call per layer, with the asteroids unsorted and grouped
+# by source surface; returns {(count, mode): (draw, frame)} in milliseconds
+def compare_render(seed = 0):
+    environment = asteroids.Background()
+    queue = asteroids.render_queue
+    clock = time.perf_counter
+    results = {}
+    print('%-8s %-10s %10s %10s %12s' % ('sprites', 'blits', 'draw ms', 'frame ms', 'calls/frame'))
+    for count, frames in RENDER_COUNTS:
+        for mode, batched, grouped in RENDER_MODES:
+            random.seed(seed)
+            player = asteroids.new_game()
+            config.MAX_ENEMY_SPRITES = count
+            populate(count, True)
+            queue.batched = batched
+            queue.sort = grouped
+            calls = queue.get_stats()['calls']
+            draw_times = []
+            frame_times = []
+            for frame in range(frames):
+                start = clock()
+                player.update()
+                for asteroid in asteroids.enemy_group:
+                    asteroid.update()
+                updated = clock()
+                environment.draw(player)
+                asteroids.draw_world(player)
+                drawn = clock()
+                draw_times.append(drawn - updated)
+                frame_times.append(drawn - start)
+            draw = sum(draw_times) / frames * 1000
+            frame = sum(frame_times) / frames * 1000
+            results[(count, mode)] = (draw, frame)
+            print('%-8d %-10s %10.3f %10.3f %12.1f' % (count, mode, draw, frame,
+                                                      (queue.get_stats()['calls'] - calls) / frames))
+    queue.batched = config.BATCH_BLITS
+    queue.sort = config.BATCH_SORT
+    return results
+
+# list every stage whose mean or p99 is slower than baseline by more than threshold
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, stages in results.items():
+        for stage, stats in stages.items():
+            for metric in ('mean', 'p99'):
+                try:
+                    reference = baseline[name][stage][metric]
+                except KeyError:
+                    continue
+                # ignore stages too short to time reliably
+                if reference > 0.05 and stats[metric] > reference * (1 + threshold):
+                    regressions.append((name, stage, metric, reference, stats[metric]))
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Asteroids game loop benchmarks')
+    parser.add_argument('scenarios', nargs = '*', default = list(SCENARIOS))
+    parser.add_argument('--baseline', default = BASELINE)
+    parser.add_argument('--update-baseline', '--save', action = 'store_true', dest = 'update_baseline',
+                        help = 'store the results as the new baseline')
+    parser.add_argument('--threshold', type = float, default = 0.25, help = 'allowed slowdown, 0.25 = 25%%')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--render', action = 'store_true', help = 'compare batched and per-sprite drawing')
+    args = parser.parse_args(argv)
+
+    asteroids.init(run_headless = True)
+    # draw into an offscreen surface rather than the display
+    asteroids.screen = pygame.Surface(config.SCREENSIZE)
+    asteroids.render_queue.surface = asteroids.screen
+    if asteroids.asteroid_field is not None:
+        asteroids.asteroid_field.surface = asteroids.screen
+    max_enemies = config.MAX_ENEMY_SPRITES
+
+    if args.render:
+        compare_render(args.seed)
+        config.MAX_ENEMY_SPRITES = max_enemies
+        return 0
+
+    results = {}
+    print('%-18s %-8s %10s %10s' % ('scenario', 'stage', 'mean ms', 'p99 ms'))
+    for name in args.scenarios:
+        results[name], pairs = run_scenario(name, args.seed)
+        for stage in STAGES:
+            stats = results[name][stage]
+            print('%-18s %-8s %10.3f %10.3f' % (name, stage, stats['mean'], stats['p99']))
+        print('%-18s pairs/frame: circle %.1f tested %.1f rejected, mask %.1f tested %.1f rejected, %.1f hits' % (
+            '', pairs['circle_tests'], pairs['circle_rejects'], pairs['mask_tests'], pairs['mask_rejects'], pairs['hits']))
+    config.MAX_ENEMY_SPRITES = max_enemies
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent = 2, sort_keys = True)
+        print('baseline saved to', args.baseline)
+        return 0
+
+    try:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    except FileNotFoundError:
+        print('no baseline at', args.baseline, '- run with --update-baseline to create one')
+        return 2
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, stage, metric, reference, value in regressions:
+        print('REGRESSION %s %s %s: %.3f ms -> %.3f ms' % (name, stage, metric, reference, value))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
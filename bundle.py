@@ -0,0 +1,227 @@
+#! python3
+'''
+Description         :   Preprocessed asset bundle. The build step decodes every
+                        image in gfx/ (and sound in snd/) once and packs the
+                        pixels, in the byte order of the usual 32-bit display
+                        format with alpha, into a single file with an index.
+                        The game memory-maps the bundle and only materialises
+                        an asset the first time it is asked for; where the
+                        display uses that format the surface is blitted
+                        straight from the mapping. A bundle older than any of
+                        its source files is not used.
+Usage               :   python bundle.py build     - write config.ASSET_BUNDLE
+                        python bundle.py report    - compare startup times
+'''
+
+import os
+import sys
+import json
+import mmap
+import struct
+import subprocess
+import pygame
+import config
+
+MAGIC = b'ASTB'
+VERSION = 2
+HEADER = struct.Struct('<4sIII')    # magic, version, index length, data start
+ALIGN = 16
+PIXEL_FORMAT = 'BGRA'               # byte order of 32-bit ARGB surfaces on little-endian machines
+ASSET_FOLDERS = ('gfx', 'snd')
+
+# Asset bundle class; open() returns None when there is no bundle to use
+class AssetBundle:
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        # pages are read on first touch and become private when written
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_COPY)
+        magic, version, index_length, self.data_start = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %d asset bundle' % (filename, VERSION))
+        self.index = json.loads(self.map[HEADER.size:HEADER.size + index_length].decode('utf-8'))
+        self.loaded = {}
+        self.alpha_masks = None
+
+    # a bundle that is missing, out of date or from another version is
+    # ignored, with a warning for the last two; the game then loads the
+    # source files
+    @classmethod
+    def open(cls, filename):
+        if not os.path.exists(filename):
+            return None
+        try:
+            bundle = cls(filename)
+        except ValueError as message:
+            print('ignoring asset bundle:', message)
+            return None
+        stale = bundle.stale_sources()
+        if stale:
+            print('ignoring stale asset bundle %s (changed: %s); run python bundle.py build'
+                  % (filename, ', '.join(stale)))
+            bundle.close()
+            return None
+        return bundle
+
+    # source files changed, removed or added since the bundle was built
+    def stale_sources(self):
+        stale = []
+        for name, entry in self.index.items():
+            try:
+                stat = os.stat(entry['source'])
+            except OSError:
+                stale.append(name)
+                continue
+            if stat.st_mtime_ns != entry['mtime'] or stat.st_size != entry['bytes']:
+                stale.append(name)
+        stale += [name for name in source_files() if name not in self.index]
+        return stale
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def _view(self, entry):
+        start = self.data_start + entry['offset']
+        return memoryview(self.map)[start:start + entry['length']]
+
+    # display format surface with per-pixel alpha; the mapped pixels are used
+    # as they are when they already match the display's format, otherwise
+    # they are converted once. The mapping is copy-on-write, so the surface
+    # can be drawn on without touching the file; it is the same surface for
+    # every call with a name. Needs the display mode to be set
+    def image(self, name):
+        surface = self.loaded.get(name)
+        if surface is None:
+            entry = self.index[name]
+            surface = pygame.image.frombuffer(self._view(entry), entry['size'], entry['format'])
+            if self.alpha_masks is None:
+                self.alpha_masks = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks()
+            if surface.get_masks() != self.alpha_masks:
+                surface = surface.convert_alpha()
+            self.loaded[name] = surface
+        return surface
+
+    def sound(self, name):
+        sound = self.loaded.get(name)
+        if sound is None:
+            sound = pygame.mixer.Sound(buffer = self._view(self.index[name]))
+            self.loaded[name] = sound
+        return sound
+
+    def close(self):
+        self.loaded.clear()
+        self.map.close()
+        self.file.close()
+
+# name: path of every asset file the bundle is built from
+def source_files():
+    files = {}
+    for folder in ASSET_FOLDERS:
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(('.png', '.ogg', '.wav')):
+                files[name] = os.path.join(folder, name)
+    return files
+
+# decode every asset once and write the bundle
+def build(filename = None):
+    filename = filename or config.ASSET_BUNDLE
+    index = {}
+    blobs = []
+    offset = 0
+    for name, path in source_files().items():
+        if name.endswith('.png'):
+            image = pygame.image.load(path)
+            data = pygame.image.tobytes(image, PIXEL_FORMAT)
+            index[name] = {'type': 'image', 'size': image.get_size(), 'format': PIXEL_FORMAT}
+        elif name.endswith(('.ogg', '.wav')):
+            # stored decoded so the mixer can use it as a raw buffer
+            data = pygame.mixer.Sound(path).get_raw()
+            index[name] = {'type': 'sound'}
+        stat = os.stat(path)
+        padding = -offset % ALIGN
+        blobs.append(b'\0' * padding + data)
+        index[name].update(offset = offset + padding, length = len(data), source = path,
+                           mtime = stat.st_mtime_ns, bytes = stat.st_size)
+        offset += padding + len(data)
+
+    # offsets are relative to the aligned data block after the index
+    encoded = json.dumps(index).encode('utf-8')
+    start = HEADER.size + len(encoded)
+    start += -start % ALIGN
+    with open(filename, 'wb') as bundle_file:
+        bundle_file.write(HEADER.pack(MAGIC, VERSION, len(encoded), start))
+        bundle_file.write(encoded)
+        bundle_file.write(b'\0' * (start - HEADER.size - len(encoded)))
+        for blob in blobs:
+            bundle_file.write(blob)
+    return filename, len(index)
+
+# drop the asset files from the page cache so the next read comes from
+# disk, on filesystems that honour the hint; False where the platform cannot
+def evict_assets(use_bundle):
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    paths = list(source_files().values())
+    if use_bundle:
+        paths.append(config.ASSET_BUNDLE)
+    for path in paths:
+        descriptor = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(descriptor)
+    return True
+
+# time startup in a fresh interpreter: import + init(), and from there to the
+# first frame, which is when the images are loaded. Median of the runs; cold
+# runs evict the asset files first, warm runs find them in the page cache.
+# Either way Python and pygame themselves are cached after the first run
+def time_startup(use_bundle, cold, runs = 5):
+    code = ('import time; start = time.perf_counter(); import config; config.ASSET_BUNDLE = %r; '
+            'import asteroids; asteroids.init(run_headless = True); startup = time.perf_counter() - start; '
+            'start = time.perf_counter(); environment = asteroids.Background(); player = asteroids.new_game(); '
+            'asteroids.update_world(player); asteroids.draw_frame(environment, player); '
+            'print(startup, time.perf_counter() - start)'
+            % (config.ASSET_BUNDLE if use_bundle else ''))
+    times = []
+    for run in range(runs):
+        if cold:
+            evict_assets(use_bundle)
+        output = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True).stdout
+        times.append([float(value) for value in output.split()[-2:]])
+    return sorted(times)[len(times) // 2]
+
+def report():
+    # one untimed run so the interpreter and libraries are cached for both
+    time_startup(False, False, runs = 1)
+    passes = [('warm', False)]
+    if evict_assets(True):
+        passes.insert(0, ('cold', True))
+    header = '%-10s' % 'loader'
+    for label, cold in passes:
+        header += ' %14s %14s' % (label + ' startup', label + ' 1st frame')
+    print(header)
+    for loader, use_bundle in (('png', False), ('bundle', True)):
+        line = '%-10s' % loader
+        for label, cold in passes:
+            startup, first_frame = time_startup(use_bundle, cold)
+            line += ' %14.1f %14.1f' % (startup * 1000, first_frame * 1000)
+        print(line)
+    print('times in ms; startup is import + init(), 1st frame is from there to the first frame drawn')
+    if len(passes) == 1:
+        print('no cold times: this platform cannot drop files from the page cache')
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    pygame.init()
+    if command == 'build':
+        print('wrote %s (%d assets)' % build())
+    elif command == 'report':
+        if not os.path.exists(config.ASSET_BUNDLE):
+            build()
+        report()
+    else:
+        print(__doc__)
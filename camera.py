@@ -0,0 +1,92 @@
+#! python3
+'''
+Description         :   Camera over a world larger than the screen. The view
+                        is centred on the ship and world positions map to the
+                        screen modulo the world size, so the view can straddle
+                        the wrap seam. Sprites outside the view are culled
+                        before they are rotated or drawn; the visible and total
+                        counts are kept for every tick. With config.WORLDSIZE
+                        equal to the screen size the camera never moves.
+'''
+
+from collections import deque
+import config
+
+# Camera class; margin is the largest half size of a sprite, so one that is
+# partly on screen still counts as visible
+class Camera:
+    def __init__(self, view_size = None, world_size = None, margin = 0, history = None):
+        self.view_size = tuple(view_size or config.SCREENSIZE)
+        self.world_size = tuple(world_size or config.WORLDSIZE)
+        # the world must be at least a sprite wider than the view on both
+        # sides for every sprite to appear only once; a screen sized world is
+        # wrapped with ghosts instead, see wrap.EdgeBand
+        self.scrolling = self.world_size != self.view_size
+        self.origin = (0.0, 0.0)       # world position of the top left of the view
+        self.margin = margin
+        self.visible = 0
+        self.total = 0
+        self.history = deque(maxlen = history or config.PROFILE_FRAMES)
+
+    # centre the view on a world position
+    def follow(self, pos):
+        if self.scrolling:
+            self.origin = (pos[0] - self.view_size[0] / 2.0, pos[1] - self.view_size[1] / 2.0)
+
+    def get_centre(self):
+        return (self.origin[0] + self.view_size[0] / 2.0, self.origin[1] + self.view_size[1] / 2.0)
+
+    # screen position of a world position; also works on a numpy array of
+    # positions, one per row
+    def to_screen(self, pos):
+        if not self.scrolling:
+            return pos[0], pos[1]
+        margin = self.margin
+        return ((pos[0] - self.origin[0] + margin) % self.world_size[0] - margin,
+                (pos[1] - self.origin[1] + margin) % self.world_size[1] - margin)
+
+    # a world space rect moved to the screen; the rect itself when the camera
+    # does not move
+    def place(self, rect):
+        if not self.scrolling:
+            return rect
+        placed = rect.copy()
+        placed.center = self.to_screen(rect.center)
+        return placed
+
+    def sees(self, pos):
+        if not self.scrolling:
+            return True
+        x, y = self.to_screen(pos)
+        return x < self.view_size[0] + self.margin and y < self.view_size[1] + self.margin
+
+    # True for every row of a numpy array of positions that is on screen
+    def sees_array(self, pos):
+        x, y = self.to_screen((pos[:, 0], pos[:, 1]))
+        return (x < self.view_size[0] + self.margin) & (y < self.view_size[1] + self.margin)
+
+    # the sprites of a group that are on screen, found through its spatial
+    # hash; counts towards this tick's visible and total counts
+    def cull(self, index, group):
+        if self.scrolling:
+            reach = max(self.view_size) / 2.0 + self.margin
+            visible = [sprite for sprite in index.query(self.get_centre(), reach) if self.sees(sprite.get_position())]
+        else:
+            visible = group
+        self.visible += len(visible)
+        self.total += len(group)
+        return visible
+
+    def end_tick(self):
+        self.history.append((self.visible, self.total))
+        self.visible = 0
+        self.total = 0
+
+    # visible and total counts for the last tick and their means over the
+    # kept history
+    def get_stats(self):
+        visible, total = self.history[-1] if self.history else (0, 0)
+        count = len(self.history) or 1
+        return {'visible': visible, 'total': total,
+                'mean_visible': sum(tick[0] for tick in self.history) / count,
+                'mean_total': sum(tick[1] for tick in self.history) / count}
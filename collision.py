@@ -0,0 +1,77 @@
+#! python3
+'''
+Description         :   Two-phase collision test. The circle test on the
+                        sprites' radii is the broadphase; pairs it passes are
+                        confirmed with pixel masks, which a rotation cache
+                        builds once per source image and quantized angle. The
+                        cache must be kept at a fixed step and filtering so
+                        hits do not depend on rendering quality.
+                        Sprites crossing a screen edge are also tested through
+                        their wraparound ghosts. Every tick records how many
+                        pairs each phase tested and rejected.
+'''
+
+from collections import deque
+import config
+
+# per-tick counters; a pair tested by the mask phase has passed the circle phase
+PHASES = ('circle_tests', 'circle_rejects', 'mask_tests', 'mask_rejects', 'hits')
+
+# Narrowphase class; test() replaces a bare sprite.collide(other)
+class Narrowphase:
+    def __init__(self, rotation_cache, edge_band = None, enabled = None, history = None):
+        self.rotation_cache = rotation_cache
+        self.edge_band = edge_band
+        self.enabled = config.PIXEL_COLLISIONS if enabled is None else enabled
+        self.counts = [0] * len(PHASES)
+        self.history = deque(maxlen = history or config.PROFILE_FRAMES)
+
+    def mask(self, sprite):
+        return self.rotation_cache.get_mask(sprite.orig_image, sprite.get_angle())
+
+    # a pair also collides across the screen edge if either of them crosses it
+    def test(self, sprite, other):
+        if self.test_pair(sprite, other):
+            return True
+        if self.edge_band is not None:
+            for ghost in self.edge_band.proxies(other):
+                if self.test_pair(sprite, ghost):
+                    return True
+            for ghost in self.edge_band.proxies(sprite):
+                if self.test_pair(ghost, other):
+                    return True
+        return False
+
+    def test_pair(self, sprite, other):
+        counts = self.counts
+        counts[0] += 1
+        if not sprite.collide(other):
+            counts[1] += 1
+            return False
+        if self.enabled:
+            counts[2] += 1
+            mask = self.mask(sprite)
+            other_mask = self.mask(other)
+            # both rotated images are centred on their sprite's position
+            centre = sprite.get_centre()
+            other_centre = other.get_centre()
+            width, height = mask.get_size()
+            other_width, other_height = other_mask.get_size()
+            offset = (int(round(other_centre[0] - other_width / 2.0)) - int(round(centre[0] - width / 2.0)),
+                      int(round(other_centre[1] - other_height / 2.0)) - int(round(centre[1] - height / 2.0)))
+            if mask.overlap(other_mask, offset) is None:
+                counts[3] += 1
+                return False
+        counts[4] += 1
+        return True
+
+    def end_tick(self):
+        self.history.append(tuple(self.counts))
+        self.counts = [0] * len(PHASES)
+
+    # mean pairs per tick for every phase over the kept history
+    def get_means(self):
+        if not self.history:
+            return dict.fromkeys(PHASES, 0.0)
+        return dict((phase, sum(tick[i] for tick in self.history) / len(self.history))
+                    for i, phase in enumerate(PHASES))
@@ -5,18 +5,61 @@
 # Graphic settings
 FULLSCREEN = False
 SCREENSIZE = [800, 600] #[640 ,480]
+WORLDSIZE = SCREENSIZE              # arena size; larger than the screen follows the ship with a camera
 DISPLAY_MOUSE = False
 DEBRIS_SCROLL_RATE = [-1, 0]
+BACKGROUND_LAYERS = [('nebula_blue.png', [0, 0]),          # (image, scroll rate), bottom first
+                     ('debris_blend.png', DEBRIS_SCROLL_RATE)]
 SHOW_FPS = True
+PROFILE = False                     # record per-stage frame times (F3 toggles the overlay)
+PROFILE_FRAMES = 240                # frames kept in the profiler ring buffer
+PROFILE_EXPORT = 'profile.csv'      # written on exit; use a .json name for JSON
+ROTATION_STEP = 2                   # degrees between cached sprite rotations
+ROTATION_CACHE_BYTES = 32 * 1024 * 1024
+ROTATION_PREWARM = False            # build every rotation at load time
+ASSET_BUNDLE = 'assets.bundle'      # built by 'python bundle.py build'; PNGs are used without it or when it is stale
+PACK_SPRITES = False                # pack small sprites into one atlas surface
+DIRTY_RECTS = False                 # update only changed screen regions
+DIRTY_RECT_THRESHOLD = 0.5          # fraction of the screen above which a full update is used
+BATCH_BLITS = True                  # draw each frame with one Surface.blits() call per layer
+BATCH_SORT = False                  # group the asteroids' blits by source surface
 
 # Audio settings
 SOUND = False
 
 # Gameplay parameters
 TITLE = "Asteroids"
-FPS = 30
+FPS = 30                            # render rate cap
+SIM_RATE = 30                       # simulation ticks per second
+MAX_CATCHUP_TICKS = 5               # ticks run in one frame before the game slows instead
+INTERPOLATE = True                  # draw sprites between the last two ticks
+THREADED = False                    # simulate on a separate thread from rendering; see asteroids.THREADED_UNSUPPORTED
+LOW_LATENCY = False                 # tick as soon as input arrives and draw the newest tick
+INPUT_LATENCY = False               # record input-to-display latency; histograms printed on exit
+INPUT_POLL_MS = 1                   # polling interval while waiting for the next frame
 MAX_ENEMY_SPRITES = 12
+SLEEP_DISTANCE = 1000               # asteroids further than this from the ship sleep (larger worlds only)
+SLEEP_TICKS = 8                     # ticks between updates of a sleeping asteroid
 DIFFICULTY = 1
+VECTOR_SPAWN = True                 # place spawns with batched numpy checks when available
+SPAWN_BATCH = 64                    # spawn candidates sampled per batch
 SHIP_SPEED = 4
 SHIP_ACCEL = 1.3
 SHIP_DECEL = 0.95
+MISSILE_SPEED = 6
+MISSILE_RELOAD = 5                  # ticks between missiles while fire is held
+MISSILE_CAPACITY = 64               # the oldest missile is reused beyond this
+RECORD_FILE = None                  # e.g. 'session.rec'; replay with 'python replay.py session.rec'
+GOVERNOR = False                    # trade rendering quality for frame rate when over budget
+GOVERNOR_WINDOW = 30                # frames averaged per decision
+GOVERNOR_HIGH = 0.9                 # step quality down above this fraction of the frame budget
+GOVERNOR_LOW = 0.5                  # and back up below this one
+GOVERNOR_LOG = 'governor.csv'       # knob changes, written on exit
+SAVE_FILE = 'savegame.snap'         # F5 saves, F9 loads
+SNAPSHOT_KEY_INTERVAL = 30          # ticks between snapshot key frames
+REWIND_SECONDS = 0                  # history kept for rewinding (backspace); 0 turns it off
+REWIND_STEP = 1                     # seconds rewound per key press
+SPECTATOR_PORT = None               # e.g. 7777; watch with 'python snapshot.py watch 7777'
+COLLISION_CELL_SIZE = 100           # broadphase grid cell size in pixels
+PIXEL_COLLISIONS = True             # confirm circle hits with per-angle pixel masks
+NUMPY_PHYSICS = False               # batch asteroid physics in numpy arrays (needs numpy)
@@ -0,0 +1,93 @@
+#! python3
+'''
+Description         :   Adaptive quality governor. The time each frame spends
+                        working (everything but the frame-rate sleep) is
+                        averaged over a window of frames and compared with the
+                        config.FPS budget; quality steps down when the budget
+                        is overrun and back up only after a longer run of spare
+                        time. Every knob change is logged.
+'''
+
+import csv
+import time
+import config
+
+# knobs in the order they appear in a level
+KNOBS = ('hud_interval', 'explosion_frame_skip', 'smooth_rotation', 'rotation_step',
+         'background_layers', 'enemy_cap')
+
+# quality levels, best first; None means the config default (every layer for
+# background_layers) and enemy_cap is a fraction of config.MAX_ENEMY_SPRITES
+LEVELS = (
+    (1, 1, True, None, None, 1.0),
+    (5, 1, True, None, None, 1.0),
+    (5, 2, True, None, None, 1.0),
+    (5, 2, False, None, None, 1.0),
+    (10, 3, False, 5, None, 1.0),
+    (10, 3, False, 5, 1, 1.0),
+    (10, 4, False, 10, 1, 0.75),
+    (15, 4, False, 10, 1, 0.5),
+)
+
+# Governor class; apply(knob, value) is called for every knob that changes
+class Governor:
+    def __init__(self, apply, fps = None, window = None, levels = LEVELS):
+        self.apply = apply
+        self.budget = 1.0 / (fps or config.FPS)
+        self.window = window or config.GOVERNOR_WINDOW
+        self.levels = levels
+        self.level = 0
+        self.frames = 0
+        self.busy = 0.0
+        self.count = 0
+        self.over = 0
+        self.under = 0
+        self.cooldown = 0
+        self.log = []
+        self.start = time.perf_counter()
+
+    # busy is the time the frame spent working, in seconds
+    def frame(self, busy):
+        self.frames += 1
+        self.busy += busy
+        self.count += 1
+        if self.count < self.window:
+            return
+        load = self.busy / self.count / self.budget
+        self.busy = 0.0
+        self.count = 0
+        if self.cooldown:
+            # caches are refilling after a change; the window is not representative
+            self.cooldown -= 1
+            return
+
+        self.over = self.over + 1 if load > config.GOVERNOR_HIGH else 0
+        self.under = self.under + 1 if load < config.GOVERNOR_LOW else 0
+        if self.over >= 2 and self.level < len(self.levels) - 1:
+            self.set_level(self.level + 1, load)
+        elif self.under >= 4 and self.level > 0:
+            self.set_level(self.level - 1, load)
+
+    def set_level(self, level, load = 0.0):
+        old, new = self.levels[self.level], self.levels[level]
+        for knob, before, after in zip(KNOBS, old, new):
+            if before != after:
+                self.apply(knob, after)
+                entry = (time.perf_counter() - self.start, self.frames, level, knob, before, after, load)
+                self.log.append(entry)
+                print('governor: %.1f s frame %d level %d %s %r -> %r (load %.2f)' % entry)
+        self.level = level
+        self.over = 0
+        self.under = 0
+        self.cooldown = 1
+
+    def export(self, filename = None):
+        filename = filename or config.GOVERNOR_LOG
+        with open(filename, 'w', newline = '') as log:
+            writer = csv.writer(log)
+            writer.writerow(('seconds', 'frame', 'level', 'knob', 'old', 'new', 'load'))
+            writer.writerows(self.log)
+        return filename
+
+    def get_stats(self):
+        return {'level': self.level, 'changes': len(self.log), 'frames': self.frames}
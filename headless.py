@@ -0,0 +1,55 @@
+#! python3
+'''
+Description         :   Headless, uncapped simulation. Steps the same
+                        Spaceship/Asteroid/spawner/collision logic as the game
+                        without a window, rendering or a frame cap and reports
+                        summary stats. Usage: python headless.py [ticks] [seed]
+'''
+
+import sys
+import time
+import random
+import asteroids
+
+# run a game for a fixed number of ticks as fast as the CPU allows.
+# pilot, if given, is called as pilot(tick, player) before every tick;
+# until_dead ends the game early once the player has no lives left
+def run(ticks, seed = None, pilot = None, until_dead = False):
+    asteroids.init(run_headless = True)
+    random.seed(seed)
+    player = asteroids.new_game()
+    ship_collisions = 0
+    survival_ticks = None
+
+    start = time.perf_counter()
+    for tick in range(ticks):
+        if pilot is not None:
+            pilot(tick, player)
+        if asteroids.update_world(player):
+            ship_collisions += 1
+            if player.get_lives() <= 0 and survival_ticks is None:
+                survival_ticks = tick + 1
+                if until_dead:
+                    ticks = tick + 1
+                    break
+    elapsed = time.perf_counter() - start
+
+    return {'ticks': ticks,
+            'seed': seed,
+            'elapsed': elapsed,
+            'ticks_per_second': ticks / elapsed if elapsed else float('inf'),
+            'score': asteroids.score,
+            'lives': player.get_lives(),
+            'ship_collisions': ship_collisions,
+            'survival_ticks': ticks if survival_ticks is None else survival_ticks,
+            'enemies': len(asteroids.enemy_group),
+            'pools': asteroids.pool_stats(),
+            'collision_pairs': asteroids.narrowphase.get_means(),
+            'edge_sprites': asteroids.edge_band.get_stats()['mean_edge_sprites'],
+            'visible': asteroids.camera.get_stats()}
+
+if __name__ == '__main__':
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    for key, value in run(ticks, seed).items():
+        print(key + ':', value)
@@ -0,0 +1,110 @@
+#! python3
+'''
+Description         :   On-screen text. Rendered text is cached by
+                        (text, font, colour) and each HUD field is only rebuilt
+                        when its value changes; numbers are assembled from
+                        pre-rendered digit glyphs rather than rasterised.
+'''
+
+from collections import OrderedDict
+import pygame
+
+WHITE = (255, 255, 255)
+
+# Text cache class; least recently used surfaces are dropped past max_entries
+class TextCache:
+    def __init__(self, max_entries = 256):
+        self.cache = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, font, color = WHITE):
+        key = (text, font, tuple(color))
+        surface = self.cache.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.cache[key] = surface
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last = False)
+        return surface
+
+    def get_stats(self):
+        return {'entries': len(self.cache), 'hits': self.hits, 'misses': self.misses}
+
+# HUD field class; a label followed by an optional value
+class HudField:
+    def __init__(self, cache, font, label, pos, color = WHITE):
+        self.cache = cache
+        self.font = font
+        self.label = label
+        self.pos = pos
+        self.color = color
+        self.value = None
+        self.visible = True
+        self.rebuilds = 0
+        self.surface = self.cache.render(label, font, color)
+
+    def set(self, value):
+        if value != self.value:
+            self.value = value
+            self.surface = self.build()
+            self.rebuilds += 1
+
+    def build(self):
+        if isinstance(self.value, int):
+            # numbers are assembled from cached glyphs, no rasterising needed
+            glyphs = [self.cache.render(self.label, self.font, self.color)]
+            glyphs += [self.cache.render(char, self.font, self.color) for char in str(self.value)]
+            width = sum(glyph.get_width() for glyph in glyphs)
+            height = max(glyph.get_height() for glyph in glyphs)
+            surface = pygame.Surface((width, height), pygame.SRCALPHA)
+            x = 0
+            for glyph in glyphs:
+                surface.blit(glyph, (x, 0))
+                x += glyph.get_width()
+            return surface
+        if self.value is None:
+            return self.cache.render(self.label, self.font, self.color)
+        return self.cache.render(self.label + str(self.value), self.font, self.color)
+
+    def get_blit(self):
+        surface = self.surface
+        return surface, surface.get_rect(topleft = self.pos)
+
+    def draw(self, surface):
+        return surface.blit(self.surface, self.pos)
+
+# HUD class; a named collection of fields drawn together
+class Hud:
+    def __init__(self, font, cache = None):
+        self.font = font
+        self.cache = cache if cache is not None else TextCache()
+        self.fields = OrderedDict()
+
+    def add(self, name, label, pos, color = WHITE):
+        self.fields[name] = HudField(self.cache, self.font, label, pos, color)
+        return self.fields[name]
+
+    def set(self, name, value):
+        self.fields[name].set(value)
+
+    def show(self, name, visible = True):
+        self.fields[name].visible = visible
+
+    # draw every visible field; returns the rects drawn
+    def draw(self, surface):
+        return [field.draw(surface) for field in self.fields.values() if field.visible]
+
+    # (surface, rect) pairs for every visible field, for a RenderQueue
+    def get_blits(self):
+        return [field.get_blit() for field in self.fields.values() if field.visible]
+
+    def get_stats(self):
+        stats = self.cache.get_stats()
+        stats['rebuilds'] = sum(field.rebuilds for field in self.fields.values())
+        return stats
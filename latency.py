@@ -0,0 +1,109 @@
+#! python3
+'''
+Description         :   Input latency tracking. Key events are stamped when
+                        they are pulled from SDL, when the simulation tick that
+                        applies them runs and when the frame showing that tick
+                        is flipped. Waiting is done in short slices that keep
+                        polling, so events are stamped close to when they
+                        arrived rather than at the start of the next frame.
+'''
+
+import time
+from collections import deque
+import pygame
+from pygame.locals import *
+import config
+
+STAGES = ('queued', 'displayed', 'total')  # arrival->tick, tick->flip, arrival->flip
+SPIN = 0.001                                # the last part of a wait is spun, not slept
+
+# sleep until deadline; poll is called between slices if given, and the
+# wait ends early once wake, if given, returns True
+def wait_until(deadline, poll = None, interval = None, wake = None):
+    interval = (config.INPUT_POLL_MS if interval is None else interval) / 1000.0
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= SPIN:
+            break
+        if poll is not None:
+            poll()
+            if wake is not None and wake():
+                return
+            time.sleep(min(remaining - SPIN, interval))
+        else:
+            time.sleep(remaining - SPIN)
+    while time.perf_counter() < deadline:
+        pass
+
+# Input latency class; get() replaces pygame.event.get(), tick() is called
+# after each simulation tick and flipped() after each display update
+class InputLatency:
+    def __init__(self, history = 1000):
+        self.pending = []       # (event, arrived) not yet handed to the game
+        self.handled = []       # arrival times of key events waiting for a tick
+        self.simulated = []     # (arrived, consumed) waiting for a flip
+        self.samples = dict((stage, deque(maxlen = history)) for stage in STAGES)
+
+    def poll(self):
+        now = time.perf_counter()
+        self.pending.extend((event, now) for event in pygame.event.get())
+
+    def wait(self, deadline):
+        wait_until(deadline, self.poll)
+
+    # True while a key event is waiting to be handed to the game
+    def key_waiting(self):
+        return any(event.type in (KEYDOWN, KEYUP) for event, arrived in self.pending)
+
+    def get(self):
+        self.poll()
+        events = self.pending
+        self.pending = []
+        self.handled.extend(arrived for event, arrived in events if event.type in (KEYDOWN, KEYUP))
+        return [event for event, arrived in events]
+
+    def tick(self):
+        if self.handled:
+            now = time.perf_counter()
+            self.simulated.extend((arrived, now) for arrived in self.handled)
+            self.handled = []
+
+    def flipped(self):
+        if not self.simulated:
+            return
+        now = time.perf_counter()
+        for arrived, consumed in self.simulated:
+            self.samples['queued'].append(consumed - arrived)
+            self.samples['displayed'].append(now - consumed)
+            self.samples['total'].append(now - arrived)
+        self.simulated = []
+
+    # counts per bucket_ms wide bucket; the last bucket holds everything above
+    def histogram(self, stage, bucket_ms = 5, buckets = 12):
+        counts = [0] * buckets
+        for sample in self.samples[stage]:
+            counts[min(buckets - 1, int(sample * 1000 / bucket_ms))] += 1
+        return counts
+
+    def get_summary(self):
+        summary = {}
+        for stage in STAGES:
+            samples = sorted(self.samples[stage])
+            if samples:
+                summary[stage] = {'count': len(samples),
+                                  'mean_ms': sum(samples) / len(samples) * 1000,
+                                  'p50_ms': samples[len(samples) // 2] * 1000,
+                                  'p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000}
+        return summary
+
+    def report(self, bucket_ms = 5, buckets = 12):
+        lines = []
+        for stage, stats in self.get_summary().items():
+            lines.append('%s: n=%d mean %.1f ms, p50 %.1f ms, p99 %.1f ms' % (
+                stage, stats['count'], stats['mean_ms'], stats['p50_ms'], stats['p99_ms']))
+            counts = self.histogram(stage, bucket_ms, buckets)
+            width = max(counts)
+            for bucket, count in enumerate(counts):
+                label = '>=%d' % (bucket * bucket_ms) if bucket == buckets - 1 else '%d-%d' % (bucket * bucket_ms, (bucket + 1) * bucket_ms)
+                lines.append('  %8s ms %5d %s' % (label, count, '#' * (40 * count // width if width else 0)))
+        return '\n'.join(lines)
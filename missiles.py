@@ -0,0 +1,213 @@
+#! python3
+'''
+Description         :   Missiles in a fixed-capacity ring buffer. Every missile
+                        has the same lifespan, so the oldest is always at the
+                        tail and expiry just advances it; firing writes the
+                        head slot, reusing the oldest when the buffer is full.
+                        Movement and wraparound are one NumPy step for all of
+                        them, and missiles crossing a screen edge are drawn
+                        again on the far side. The buffer behaves enough like
+                        a sprite group to be passed to group_group_collide().
+                        Requires numpy.
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import pygame
+import config
+from spatial import dist_sq
+
+# Missile buffer class; a missile that hits something is marked dead and its
+# slot is reclaimed when the tail reaches it
+class MissileBuffer:
+    def __init__(self, image, info, surface, camera = None, capacity = None):
+        if np is None:
+            raise ImportError("MissileBuffer requires numpy")
+        self.image = image
+        self.radius = info.get_radius()
+        self.lifespan = info.get_lifespan()
+        self.surface = surface
+        self.camera = camera
+        self.capacity = capacity or config.MISSILE_CAPACITY
+        self.pos = np.zeros((self.capacity, 2))
+        self.prev_pos = np.zeros((self.capacity, 2))
+        self.vel = np.zeros((self.capacity, 2))
+        self.birth = np.zeros(self.capacity, dtype = np.int64)
+        self.alive = np.zeros(self.capacity, dtype = bool)
+        self.ident = np.zeros(self.capacity, dtype = np.uint32)    # snapshot entity id, 0 until captured
+        self.bounds = np.array(config.WORLDSIZE, dtype = np.float64)
+        self.half_size = np.array(image.get_size(), dtype = np.float64) / 2
+        self.head = 0       # slot the next missile is written to
+        self.count = 0      # slots in use from the tail up to the head, dead or alive
+        self.live = 0
+        self.tick = 0
+        self.handles = [Missile(self, index) for index in range(self.capacity)]
+        self.fired = 0
+        self.expired = 0
+        self.reused = 0
+
+    def __len__(self):
+        return self.live
+
+    def __iter__(self):
+        return iter([self.handles[index] for index in np.flatnonzero(self.alive)])
+
+    def __contains__(self, missile):
+        return missile.buffer is self and bool(self.alive[missile.index])
+
+    def tail(self):
+        return (self.head - self.count) % self.capacity
+
+    # slot indices from the tail to the head
+    def slots(self):
+        return (np.arange(self.count) + self.tail()) % self.capacity
+
+    def live_slots(self):
+        return np.flatnonzero(self.alive)
+
+    def spawn(self, pos, vel, age = 0):
+        if self.count == self.capacity:
+            tail = self.tail()
+            if self.alive[tail]:
+                self.alive[tail] = False
+                self.live -= 1
+                self.reused += 1
+            self.count -= 1
+        index = self.head
+        self.pos[index] = pos
+        self.prev_pos[index] = pos
+        self.vel[index] = vel
+        self.birth[index] = self.tick - age
+        self.ident[index] = 0
+        self.alive[index] = True
+        self.head = (index + 1) % self.capacity
+        self.count += 1
+        self.live += 1
+        self.fired += 1
+        return self.handles[index]
+
+    def discard(self, missile):
+        if self.alive[missile.index]:
+            self.alive[missile.index] = False
+            self.live -= 1
+
+    def difference_update(self, missiles):
+        for missile in missiles:
+            self.discard(missile)
+
+    def clear(self):
+        self.alive[:] = False
+        self.count = 0
+        self.live = 0
+
+    def step(self):
+        self.tick += 1
+        while self.count and self.tick - self.birth[self.tail()] >= self.lifespan:
+            tail = self.tail()
+            if self.alive[tail]:
+                self.alive[tail] = False
+                self.live -= 1
+                self.expired += 1
+            self.count -= 1
+        if not self.count:
+            return
+        slots = self.slots()
+        pos = self.pos[slots]
+        self.prev_pos[slots] = pos
+        self.pos[slots] = (pos + self.vel[slots]) % self.bounds
+
+    # live missiles within margin of a screen edge
+    def near_edges(self, margin):
+        live = np.flatnonzero(self.alive)
+        pos = self.pos[live]
+        near = ((pos < margin) | (pos > self.bounds - margin)).any(axis = 1)
+        return [self.handles[index] for index in live[near]]
+
+    # (image, rect) pairs for every live missile and its wrapped copies;
+    # alpha interpolates between the last two ticks except for missiles that
+    # wrapped
+    def get_blits(self, alpha = None):
+        live = np.flatnonzero(self.alive)
+        if not len(live):
+            return []
+        pos = self.pos[live]
+        if alpha is not None:
+            previous = self.prev_pos[live]
+            moved = pos - previous
+            wrapped = (np.abs(moved) > self.bounds / 2).any(axis = 1)
+            pos = np.where(wrapped[:, None], pos, previous + moved * alpha)
+        if self.camera is not None and self.camera.scrolling:
+            # the camera maps the world onto the screen across the seam
+            pos = pos[self.camera.sees_array(pos)]
+            pos = np.stack(self.camera.to_screen((pos[:, 0], pos[:, 1])), axis = 1)
+        else:
+            # shift missiles hanging over the left/top edge by a screen size
+            # to the right/bottom and vice versa; corners need both shifts
+            shift = (self.bounds * (pos - self.half_size < 0) -
+                     self.bounds * (pos + self.half_size > self.bounds))
+            crossing = shift.any(axis = 1)
+            if crossing.any():
+                edge, shift = pos[crossing], shift[crossing]
+                across = shift[:, 0] != 0
+                down = shift[:, 1] != 0
+                corner = across & down
+                pos = np.concatenate((pos, edge[across] + shift[across] * (1, 0),
+                                      edge[down] + shift[down] * (0, 1), edge[corner] + shift[corner]))
+        corners = (pos - self.half_size).round().astype(int).tolist()
+        image = self.image
+        width, height = image.get_size()
+        return [(image, pygame.Rect(x, y, width, height)) for x, y in corners]
+
+    # one blits() call for every live missile; returns the rects drawn
+    def draw(self, alpha = None):
+        return self.surface.blits(self.get_blits(alpha))
+
+    def get_stats(self):
+        return {'live': self.live, 'slots': self.count, 'fired': self.fired,
+                'expired': self.expired, 'reused': self.reused}
+
+# Thin handle exposing the Sprite interface for one slot; the buffer owns one
+# per slot so firing never allocates
+class Missile:
+    __slots__ = ('buffer', 'index', 'orig_image', 'pool')
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+        self.orig_image = buffer.image
+        self.pool = None
+
+    @property
+    def pos(self):
+        return self.buffer.pos[self.index]
+
+    @property
+    def vel(self):
+        return self.buffer.vel[self.index]
+
+    @property
+    def age(self):
+        return self.buffer.tick - int(self.buffer.birth[self.index])
+
+    # missiles are round, so they are never rotated
+    angle = 0.0
+    angle_vel = 0.0
+
+    def get_radius(self):
+        return self.buffer.radius
+
+    def get_position(self):
+        return self.buffer.pos[self.index].tolist()
+
+    def get_centre(self):
+        return self.get_position()
+
+    def get_angle(self):
+        return 0.0
+
+    def collide(self, other_object):
+        radii = self.get_radius() + other_object.get_radius()
+        return dist_sq(self.get_position(), other_object.get_position()) < radii * radii
@@ -0,0 +1,203 @@
+#! python3
+'''
+Description         :   Optional batched physics for asteroids. All asteroid
+                        state lives in contiguous NumPy arrays and a whole
+                        field is advanced with a handful of vectorised
+                        operations per frame. Requires numpy.
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import config
+from spatial import dist_sq
+
+# position between the previous and current tick for rendering; sprites that
+# wrapped across the screen during the tick are drawn where they are now
+def interpolate(previous, current, alpha):
+    dx = current[0] - previous[0]
+    dy = current[1] - previous[1]
+    if abs(dx) > config.WORLDSIZE[0] / 2 or abs(dy) > config.WORLDSIZE[1] / 2:
+        return current[0], current[1]
+    return previous[0] + dx * alpha, previous[1] + dy * alpha
+
+# Asteroid field class; struct-of-arrays storage with swap-remove. Handles
+# name the field as their pool, so pool.release() hands destroyed asteroids
+# back; their slots are freed by the next prune()
+class AsteroidField:
+    def __init__(self, rotation_cache, surface, camera = None, capacity = 64):
+        if np is None:
+            raise ImportError("AsteroidField requires numpy")
+        self.rotation_cache = rotation_cache
+        self.surface = surface
+        self.camera = camera
+        self.count = 0
+        self.handles = []
+        self.freed = []         # handles released since the last prune
+        self.bounds = np.array(config.WORLDSIZE, dtype = np.float64)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = self.count
+        pos = np.zeros((capacity, 2))
+        prev_pos = np.zeros((capacity, 2))
+        vel = np.zeros((capacity, 2))
+        angle = np.zeros(capacity)
+        angle_vel = np.zeros(capacity)
+        age = np.zeros(capacity, dtype = np.int64)
+        lifespan = np.full(capacity, np.inf)
+        radius = np.zeros(capacity)
+        ident = np.zeros(capacity, dtype = np.uint32)
+        if old:
+            pos[:old] = self.pos[:old]
+            prev_pos[:old] = self.prev_pos[:old]
+            vel[:old] = self.vel[:old]
+            angle[:old] = self.angle[:old]
+            angle_vel[:old] = self.angle_vel[:old]
+            age[:old] = self.age[:old]
+            lifespan[:old] = self.lifespan[:old]
+            radius[:old] = self.radius[:old]
+            ident[:old] = self.ident[:old]
+        self.pos, self.prev_pos, self.vel, self.angle, self.angle_vel = pos, prev_pos, vel, angle, angle_vel
+        # ident is the snapshot entity id, 0 until the first capture
+        self.age, self.lifespan, self.radius, self.ident = age, lifespan, radius, ident
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, pos, vel, ang, ang_vel, image, info):
+        if self.count == self.capacity:
+            self._allocate(self.capacity * 2)
+        index = self.count
+        self.pos[index] = pos
+        self.prev_pos[index] = pos
+        self.vel[index] = vel
+        self.angle[index] = ang
+        self.angle_vel[index] = ang_vel
+        self.age[index] = 0
+        self.lifespan[index] = info.get_lifespan()
+        self.radius[index] = info.get_radius()
+        self.ident[index] = 0
+        handle = AsteroidHandle(self, index, image, info)
+        self.handles.append(handle)
+        self.count += 1
+        return handle
+
+    # free a slot now by moving the last body into it
+    def remove(self, handle):
+        index = handle.index
+        if index < 0:
+            return
+        last = self.count - 1
+        if index != last:
+            self.pos[index] = self.pos[last]
+            self.prev_pos[index] = self.prev_pos[last]
+            self.vel[index] = self.vel[last]
+            self.angle[index] = self.angle[last]
+            self.angle_vel[index] = self.angle_vel[last]
+            self.age[index] = self.age[last]
+            self.lifespan[index] = self.lifespan[last]
+            self.radius[index] = self.radius[last]
+            self.ident[index] = self.ident[last]
+            moved = self.handles[last]
+            moved.index = index
+            self.handles[index] = moved
+        self.handles.pop()
+        self.count = last
+        handle.index = -1
+
+    # pool interface, see pool.release; the body stays in its slot until
+    # the next prune
+    def release(self, handle):
+        self.freed.append(handle)
+
+    # free the slots of every handle released since the last prune; highest
+    # slot first, so the bodies moved down do not depend on release order
+    def prune(self):
+        for handle in sorted(self.freed, key = lambda handle: handle.index, reverse = True):
+            self.remove(handle)
+        self.freed.clear()
+
+    # slots of the bodies still in play, i.e. not released since the last prune
+    def live_slots(self):
+        live = np.ones(self.count, dtype = bool)
+        live[[handle.index for handle in self.freed]] = False
+        return np.flatnonzero(live)
+
+    # handles of the bodies the camera sees; every handle without a camera
+    def visible(self):
+        if self.camera is None or not self.camera.scrolling:
+            return list(self.handles)
+        return [self.handles[index] for index in np.flatnonzero(self.camera.sees_array(self.pos[:self.count]))]
+
+    # advance every body one frame; returns the handles that expired
+    def step(self):
+        n = self.count
+        if not n:
+            return []
+        self.prev_pos[:n] = self.pos[:n]
+        self.angle[:n] += self.angle_vel[:n]
+        self.angle[:n] %= 360
+        # matches Sprite.update: set_pos() then the wrapped move
+        pos = self.pos[:n]
+        pos += self.vel[:n]
+        pos += self.vel[:n]
+        pos %= self.bounds
+        self.age[:n] += 1
+        expired = np.flatnonzero(self.age[:n] >= self.lifespan[:n])
+        if not len(expired):
+            return []
+        handles = [self.handles[index] for index in expired]
+        for handle in handles:
+            self.remove(handle)
+        return handles
+
+# Thin handle exposing the Sprite interface for one body in a field
+class AsteroidHandle:
+    def __init__(self, field, index, image, info):
+        self.field = field
+        self.pool = field
+        self.index = index
+        self.orig_image = image
+        self.image = image
+        self.image_center = info.get_center()
+        self.image_size = info.get_size()
+        self.rect = image.get_rect()
+
+    def get_radius(self):
+        return self.field.radius[self.index]
+
+    def get_position(self):
+        return self.field.pos[self.index].tolist()
+
+    def get_centre(self):
+        return self.get_position()
+
+    def get_angle(self):
+        return self.field.angle[self.index]
+
+    # the field has already moved the body; refresh the rotated image and rect
+    def update(self):
+        self.image = self.field.rotation_cache.get(self.orig_image, self.field.angle[self.index])
+        self.rect = self.image.get_rect(center = self.get_position())
+        return False
+
+    # alpha interpolates between the last two ticks, see Sprite.get_blit
+    def get_blit(self, alpha = None):
+        if alpha is not None:
+            previous = self.field.prev_pos[self.index]
+            current = self.field.pos[self.index]
+            self.rect.center = interpolate(previous.tolist(), current.tolist(), alpha)
+        if self.field.camera is not None:
+            return self.image, self.field.camera.place(self.rect)
+        return self.image, self.rect
+
+    def draw(self, alpha = None):
+        return self.field.surface.blit(*self.get_blit(alpha))
+
+    def collide(self, other_object):
+        radii = self.get_radius() + other_object.get_radius()
+        return dist_sq(self.get_position(), other_object.get_position()) < radii * radii
@@ -0,0 +1,134 @@
+#! python3
+'''
+Description         :   Two-stage simulation/render pipeline. A simulation
+                        thread steps the game at a fixed rate and publishes
+                        immutable frame snapshots into a triple buffer; the
+                        main thread renders the newest snapshot. pygame's blit
+                        and transform calls release the GIL, so drawing
+                        overlaps with the next simulation step.
+'''
+
+import time
+import queue
+import threading
+from collections import deque, namedtuple
+
+# everything the renderer needs for one frame; sprites is a tuple of
+# (layer, blits) pairs, blits a tuple of (surface, rect) pairs, offsets the
+# scroll position of each background layer
+Snapshot = namedtuple('Snapshot', 'tick published sprites offsets lives score')
+
+# Triple buffer class; the writer never waits for the reader and the reader
+# always gets the newest complete snapshot
+class TripleBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slots = [None, None, None]
+        self.back, self.middle, self.front = 0, 1, 2
+        self.fresh = False
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, snapshot):
+        self.slots[self.back] = snapshot
+        with self.lock:
+            if self.fresh:
+                # the reader never saw the previous snapshot
+                self.dropped += 1
+            self.back, self.middle = self.middle, self.back
+            self.fresh = True
+            self.published += 1
+
+    # newest snapshot, or None if nothing new has been published
+    def latest(self):
+        with self.lock:
+            if not self.fresh:
+                return None
+            self.front, self.middle = self.middle, self.front
+            self.fresh = False
+        return self.slots[self.front]
+
+# Pipeline stats class; busy intervals of both threads are kept to measure
+# how much of the time they actually ran in parallel
+class PipelineStats:
+    def __init__(self, history = 600):
+        self.sim_busy = deque(maxlen = history)
+        self.render_busy = deque(maxlen = history)
+        self.latency = deque(maxlen = history)
+
+    def get_overlap(self):
+        sim = list(self.sim_busy)
+        render = list(self.render_busy)
+        if not sim or not render:
+            return 0.0
+        overlap = 0.0
+        i = j = 0
+        while i < len(sim) and j < len(render):
+            start = max(sim[i][0], render[j][0])
+            end = min(sim[i][1], render[j][1])
+            if end > start:
+                overlap += end - start
+            if sim[i][1] < render[j][1]:
+                i += 1
+            else:
+                j += 1
+        wall = max(sim[-1][1], render[-1][1]) - max(sim[0][0], render[0][0])
+        return overlap / wall if wall > 0 else 0.0
+
+    def get_summary(self):
+        latency = sorted(self.latency)
+        if not latency:
+            return {}
+        return {'overlap': self.get_overlap(),
+                'latency_mean_ms': sum(latency) / len(latency) * 1000,
+                'latency_p99_ms': latency[min(len(latency) - 1, int(len(latency) * 0.99))] * 1000}
+
+# Simulation thread class; step(events) advances the game one tick using the
+# input events queued since the last tick, snapshot() captures the result.
+# An exception in either stops the thread and is raised again by check()
+class SimulationThread(threading.Thread):
+    def __init__(self, step, snapshot, rate, buffer, stats):
+        threading.Thread.__init__(self, daemon = True)
+        self.step = step
+        self.snapshot = snapshot
+        self.tick_length = 1.0 / rate
+        self.buffer = buffer
+        self.stats = stats
+        self.events = queue.Queue()
+        self.running = True
+        self.error = None
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+    # raise, on the calling thread, whatever stopped the simulation
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        try:
+            self.simulate()
+        except BaseException as error:
+            self.error = error
+            self.running = False
+
+    def simulate(self):
+        next_tick = time.perf_counter()
+        while self.running:
+            start = time.perf_counter()
+            events = []
+            while not self.events.empty():
+                events.append(self.events.get_nowait())
+            self.step(events)
+            self.buffer.publish(self.snapshot())
+            end = time.perf_counter()
+            self.stats.sim_busy.append((start, end))
+
+            next_tick += self.tick_length
+            if next_tick > end:
+                time.sleep(next_tick - end)
+            else:
+                # too far behind to catch up; carry on from now
+                next_tick = end
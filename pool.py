@@ -0,0 +1,47 @@
+#! python3
+'''
+Description         :   Object pools for sprites. Released sprites are reset in
+                        place on the next acquire, so steady-state frames do
+                        not allocate new sprite objects.
+'''
+
+# Sprite pool class; factory is the sprite class, which must provide reset()
+# taking the same arguments as its constructor
+class SpritePool:
+    def __init__(self, factory):
+        self.factory = factory
+        self.free = []
+        self.in_use = 0
+        self.allocated = 0
+        self.acquired = 0
+        self.released = 0
+
+    def acquire(self, *args):
+        if self.free:
+            sprite = self.free.pop()
+            sprite.reset(*args)
+        else:
+            sprite = self.factory(*args)
+            self.allocated += 1
+        sprite.pool = self
+        self.acquired += 1
+        self.in_use += 1
+        return sprite
+
+    def release(self, sprite):
+        self.free.append(sprite)
+        self.released += 1
+        self.in_use -= 1
+
+    def get_stats(self):
+        return {'in_use': self.in_use, 'free': len(self.free), 'allocated': self.allocated,
+                'acquired': self.acquired, 'released': self.released}
+
+# return sprites to the pools they came from; sprites created directly, or
+# without a pool attribute, are left to the garbage collector
+def release(sprites):
+    for sprite in sprites:
+        pool = getattr(sprite, 'pool', None)
+        if pool is not None:
+            sprite.pool = None
+            pool.release(sprite)
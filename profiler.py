@@ -0,0 +1,108 @@
+#! python3
+'''
+Description         :   Per-frame stage profiler. Stage timings are kept in a
+                        fixed-size ring buffer, can be shown as a stacked
+                        frame-time graph and exported to CSV or JSON. When
+                        disabled every call returns immediately.
+'''
+
+import csv
+import json
+import time
+import pygame
+import config
+
+STAGES = ('events', 'spawn', 'sprite_update', 'rotation', 'collision', 'background_update',
+          'background_draw', 'draw', 'display', 'tick')
+
+COLORS = ((200, 200, 200), (255, 220, 0), (0, 160, 255), (160, 90, 255), (255, 60, 60),
+          (120, 120, 120), (90, 200, 90), (255, 140, 0), (255, 0, 200), (60, 60, 90))
+
+# Frame profiler class; mark() charges the time since the previous mark to a stage
+class FrameProfiler:
+    def __init__(self, frames = None, enabled = None):
+        self.frames = config.PROFILE_FRAMES if frames is None else frames
+        self.enabled = config.PROFILE if enabled is None else enabled
+        self.overlay = False
+        self.index = dict((stage, i) for i, stage in enumerate(STAGES))
+        self.samples = [[0.0] * len(STAGES) for frame in range(self.frames)]
+        self.head = 0
+        self.count = 0
+        self.current = self.samples[0]
+        self.last = 0.0
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.current = self.samples[self.head]
+        for i in range(len(STAGES)):
+            self.current[i] = 0.0
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[self.index[stage]] += now - self.last
+        self.last = now
+
+    # move time measured elsewhere (e.g. inside the rotation cache) out of
+    # the stage that contained it
+    def carve(self, from_stage, stage, seconds):
+        if not self.enabled:
+            return
+        seconds = min(seconds, self.current[self.index[from_stage]])
+        self.current[self.index[from_stage]] -= seconds
+        self.current[self.index[stage]] += seconds
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.head = (self.head + 1) % self.frames
+        self.count = min(self.count + 1, self.frames)
+
+    # recorded frames, oldest first, in milliseconds
+    def get_frames(self):
+        start = (self.head - self.count) % self.frames
+        return [[seconds * 1000 for seconds in self.samples[(start + i) % self.frames]] for i in range(self.count)]
+
+    def get_means(self):
+        frames = self.get_frames()
+        if not frames:
+            return {}
+        return dict((stage, sum(frame[i] for frame in frames) / len(frames)) for i, stage in enumerate(STAGES))
+
+    # stacked frame-time graph, one column per recorded frame; returns the rect drawn
+    def draw(self, surface, pos = (10, 10), height = 100):
+        budget = 1000.0 / config.FPS
+        scale = height / (budget * 2)
+        graph = pygame.Rect(pos[0], pos[1], self.frames, height)
+        surface.fill((0, 0, 0), graph)
+        x = graph.right - self.count
+        for frame in self.get_frames():
+            y = graph.bottom
+            for i, ms in enumerate(frame):
+                bar = min(int(ms * scale + 0.5), y - graph.top)
+                if bar > 0:
+                    y -= bar
+                    surface.fill(COLORS[i], (x, y, 1, bar))
+            x += 1
+        # line marking the frame budget for config.FPS
+        budget_y = graph.bottom - int(budget * scale)
+        pygame.draw.line(surface, (255, 255, 255), (graph.left, budget_y), (graph.right - 1, budget_y))
+        return graph
+
+    # export recorded frames; the file extension picks CSV or JSON
+    def export(self, filename = None):
+        filename = filename or config.PROFILE_EXPORT
+        frames = self.get_frames()
+        if filename.endswith('.json'):
+            with open(filename, 'w') as export_file:
+                json.dump({'stages': STAGES, 'units': 'ms', 'frames': frames}, export_file)
+        else:
+            with open(filename, 'w', newline = '') as export_file:
+                writer = csv.writer(export_file)
+                writer.writerow(('frame',) + STAGES + ('total',))
+                for number, frame in enumerate(frames):
+                    writer.writerow([number] + ['%.4f' % ms for ms in frame] + ['%.4f' % sum(frame)])
+        return filename
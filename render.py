@@ -0,0 +1,118 @@
+#! python3
+'''
+Description         :   Rendering helpers. RenderQueue collects a frame's
+                        blits and submits each layer with one Surface.blits()
+                        call. DirtyRenderer pushes only the changed parts of
+                        the screen to the display instead of the whole
+                        framebuffer every frame.
+'''
+
+import pygame
+import config
+
+# merge overlapping rects so display.update() gets fewer, larger regions
+def merge_rects(rects):
+    merged = []
+    for rect in rects:
+        for i, other in enumerate(merged):
+            if other.colliderect(rect):
+                merged[i] = other.union(rect)
+                break
+        else:
+            merged.append(pygame.Rect(rect))
+    return merged
+
+# render queue layers, bottom first. SPRITES holds the ship and anything
+# else drawn in the order queued
+BACKGROUND, HUD, SPRITES, ASTEROIDS, EXPLOSIONS, MISSILES = range(6)
+# layers that may be grouped by source surface. Asteroids only overlap each
+# other and are queued in no particular order anyway, so grouping them
+# changes nothing on screen; explosions and missiles sit on layers above
+SORTED_LAYERS = (ASTEROIDS,)
+
+# Render queue class; (surface, rect) pairs are added during the frame and
+# drawn by flush(). Unbatched, every add() blits straight away, which is the
+# per-sprite reference the batched queue is compared with
+class RenderQueue:
+    def __init__(self, surface, batched = None, sort = None):
+        self.surface = surface
+        self.batched = config.BATCH_BLITS if batched is None else batched
+        self.sort = config.BATCH_SORT if sort is None else sort
+        self.layers = [[] for layer in range(MISSILES + 1)]
+        self.rects = []
+        self.calls = 0
+        self.blits = 0
+
+    def add(self, image, rect, layer = SPRITES):
+        if self.batched:
+            self.layers[layer].append((image, rect))
+            return
+        self.surface.blit(image, rect)
+        self.calls += 1
+        self.blits += 1
+        if layer != BACKGROUND:
+            self.rects.append(rect)
+
+    def extend(self, blits, layer = SPRITES):
+        if self.batched:
+            self.layers[layer] += blits
+            return
+        for image, rect in blits:
+            self.add(image, rect, layer)
+
+    # draw everything queued, bottom layer first. Returns the rects drawn
+    # outside the background, which covers the whole screen anyway
+    def flush(self):
+        for layer, blits in enumerate(self.layers):
+            if not blits:
+                continue
+            if self.sort and layer in SORTED_LAYERS:
+                # a stable sort, so blits of one surface keep their order
+                blits.sort(key = lambda blit: id(blit[0]))
+            self.surface.blits(blits, doreturn = False)
+            self.calls += 1
+            self.blits += len(blits)
+            if layer != BACKGROUND:
+                self.rects += [rect for image, rect in blits]
+            del blits[:]
+        rects = self.rects
+        self.rects = []
+        return rects
+
+    def get_stats(self):
+        return {'calls': self.calls, 'blits': self.blits}
+
+# Dirty rectangle renderer; remembers what was drawn last frame so it can be
+# erased and included in this frame's update
+class DirtyRenderer:
+    def __init__(self, surface, threshold = None):
+        self.screen_rect = surface.get_rect()
+        self.threshold = config.DIRTY_RECT_THRESHOLD if threshold is None else threshold
+        self.previous = []
+        self.previous_area = 0
+        self.full_updates = 0
+        self.partial_updates = 0
+
+    # a full update is cheaper once most of the screen is dirty anyway, which
+    # is always the case while the background is scrolling
+    def full_update_needed(self, background_moved):
+        screen_area = self.screen_rect.width * self.screen_rect.height
+        return background_moved or self.previous_area > screen_area * self.threshold
+
+    def get_previous(self):
+        return self.previous
+
+    # push this frame to the display; rects are everything drawn this frame
+    def present(self, rects, full = False):
+        rects = [rect.clip(self.screen_rect) for rect in rects if rect]
+        if full:
+            pygame.display.update()
+            self.full_updates += 1
+        else:
+            pygame.display.update(merge_rects(self.previous + rects))
+            self.partial_updates += 1
+        self.previous = rects
+        self.previous_area = sum(rect.width * rect.height for rect in rects)
+
+    def get_stats(self):
+        return {'full_updates': self.full_updates, 'partial_updates': self.partial_updates}
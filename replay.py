@@ -0,0 +1,183 @@
+#! python3
+'''
+Description         :   Input recording and deterministic replay. A recording
+                        holds the RNG seed, every key event with the tick it
+                        was consumed on and a hash of the game state after each
+                        tick. Replays feed the events back through key_down /
+                        key_up and stop at the first tick whose hash differs.
+Usage               :   python replay.py FILE [--realtime]
+                        python replay.py --self-test
+'''
+
+import os
+import sys
+import tempfile
+import time
+import random
+import struct
+from array import array
+import pygame
+from pygame.locals import *
+import config
+
+MAGIC = b'ASTR'
+VERSION = 2                         # 2: state hashes cover missiles and the ship's fire state
+HEADER = struct.Struct('<4sHIIII')  # magic, version, seed, sim rate, ticks, events
+EVENT = struct.Struct('<IBI')       # tick, 0 = key down / 1 = key up, key
+
+# keys that act on the session rather than the game: escape ends it, F5 / F9
+# save and load and backspace rewinds. They are never recorded, and replays
+# drop them from older recordings
+SESSION_KEYS = (K_ESCAPE, K_F5, K_F9, K_BACKSPACE)
+
+# Recording class; holds the log of one session
+class Recording:
+    def __init__(self, seed, sim_rate = None):
+        self.seed = seed
+        self.sim_rate = sim_rate or config.SIM_RATE
+        self.events = []
+        self.hashes = array('I')
+
+    # the tick the next event will be applied before
+    def get_tick(self):
+        return len(self.hashes)
+
+    def add_event(self, event):
+        if event.type in (KEYDOWN, KEYUP) and event.key not in SESSION_KEYS:
+            self.events.append((self.get_tick(), 0 if event.type == KEYDOWN else 1, event.key))
+
+    def add_tick(self, state_hash):
+        self.hashes.append(state_hash)
+
+    def save(self, filename):
+        with open(filename, 'wb') as log:
+            log.write(HEADER.pack(MAGIC, VERSION, self.seed, self.sim_rate, len(self.hashes), len(self.events)))
+            for event in self.events:
+                log.write(EVENT.pack(*event))
+            log.write(self.hashes.tobytes())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as log:
+            data = log.read()
+        magic, version, seed, sim_rate, ticks, events = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %d recording' % (filename, VERSION))
+        recording = cls(seed, sim_rate)
+        offset = HEADER.size
+        for index in range(events):
+            recording.events.append(EVENT.unpack_from(data, offset))
+            offset += EVENT.size
+        recording.hashes.frombytes(data[offset:offset + ticks * recording.hashes.itemsize])
+        return recording
+
+# replay a recording; realtime shows it in a window at the recorded tick rate,
+# otherwise it runs headless and uncapped. Returns summary stats, with the
+# first divergent tick (or None)
+def replay(filename, realtime = False):
+    import asteroids
+    recording = Recording.load(filename)
+    asteroids.init(run_headless = not realtime)
+    random.seed(recording.seed)
+    player = asteroids.new_game()
+    environment = asteroids.Background()
+    events = recording.events
+    next_event = 0
+    diverged = None
+
+    start = time.perf_counter()
+    for tick in range(len(recording.hashes)):
+        while next_event < len(events) and events[next_event][0] == tick:
+            kind, key = events[next_event][1:]
+            next_event += 1
+            if key in SESSION_KEYS:
+                continue
+            event = pygame.event.Event(KEYDOWN if kind == 0 else KEYUP, key = key)
+            if kind == 0:
+                asteroids.key_down(event, player)
+            else:
+                asteroids.key_up(event, player)
+        asteroids.update_world(player)
+        if asteroids.state_hash(player) != recording.hashes[tick]:
+            diverged = tick
+            break
+        if realtime:
+            pygame.event.pump()
+            environment.update()
+            asteroids.draw_frame(environment, player)
+            asteroids.clock.tick(recording.sim_rate)
+    elapsed = time.perf_counter() - start
+
+    ticks = len(recording.hashes) if diverged is None else diverged + 1
+    return {'ticks': ticks,
+            'recorded_seconds': ticks / recording.sim_rate,
+            'elapsed': elapsed,
+            'speedup': ticks / recording.sim_rate / elapsed if elapsed else float('inf'),
+            'diverged_at': diverged}
+
+# key presses for the self test, tick: (kind, key); the session keys are
+# pressed while recording and must neither be recorded nor act on replay
+SCRIPT = {10: (0, K_UP), 40: (0, K_SPACE), 60: (1, K_UP), 100: (0, K_F5), 101: (1, K_F5),
+          150: (0, K_LEFT), 200: (0, K_F9), 201: (1, K_F9), 250: (0, K_BACKSPACE),
+          251: (1, K_BACKSPACE), 300: (1, K_LEFT), 350: (1, K_SPACE), 400: (0, K_RIGHT)}
+
+# record a scripted session headless and replay it; the replay must not
+# diverge and must not touch the save file. The recording is made at the
+# governor's lowest rotation quality and replayed at the default, which
+# must not change collisions
+def self_test(ticks = 2000, seed = 12345):
+    import asteroids
+    asteroids.init(run_headless = True)
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'self_test.rec')
+    save_file = config.SAVE_FILE
+    config.SAVE_FILE = os.path.join(directory, 'self_test.snap')
+    try:
+        recording = Recording(seed)
+        asteroids.recording = recording
+        asteroids.apply_quality('rotation_step', 30)
+        asteroids.apply_quality('smooth_rotation', False)
+        random.seed(seed)
+        player = asteroids.new_game()
+        for tick in range(ticks):
+            if tick in SCRIPT:
+                kind, key = SCRIPT[tick]
+                event = pygame.event.Event(KEYDOWN if kind == 0 else KEYUP, key = key)
+                asteroids.handle_events(player, [event])
+            asteroids.update_world(player)
+            recording.add_tick(asteroids.state_hash(player))
+        asteroids.recording = None
+        asteroids.apply_quality('rotation_step', None)
+        asteroids.apply_quality('smooth_rotation', True)
+        recorded = set(event[2] for event in recording.events)
+        if recorded & set(SESSION_KEYS):
+            raise AssertionError('session keys were recorded')
+        # recordings made before the keys were filtered still hold them
+        recording.events += [(tick, kind, key) for tick, (kind, key) in SCRIPT.items() if key in SESSION_KEYS]
+        recording.events.sort()
+        recording.save(filename)
+        result = replay(filename)
+        if result['diverged_at'] is not None:
+            raise AssertionError('replay diverged at tick %d' % result['diverged_at'])
+        if os.path.exists(config.SAVE_FILE):
+            raise AssertionError('replay wrote the save file')
+    finally:
+        asteroids.recording = None
+        asteroids.apply_quality('rotation_step', None)
+        asteroids.apply_quality('smooth_rotation', True)
+        config.SAVE_FILE = save_file
+    return result
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    if sys.argv[1] == '--self-test':
+        for key, value in self_test().items():
+            print(key + ':', value)
+        print('self test passed')
+        sys.exit(0)
+    result = replay(sys.argv[1], '--realtime' in sys.argv)
+    for key, value in result.items():
+        print(key + ':', value)
+    sys.exit(0 if result['diverged_at'] is None else 1)
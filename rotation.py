@@ -0,0 +1,115 @@
+#! python3
+'''
+Description         :   Shared cache of pre-rotated sprite images. Angles are
+                        snapped to config.ROTATION_STEP degrees so every sprite
+                        using the same source image shares one set of surfaces.
+                        Collision masks are cached alongside the surfaces.
+'''
+
+import time
+from collections import OrderedDict
+import pygame
+import config
+
+# Rotation cache class; least recently used surfaces are dropped once the
+# cache grows past its memory cap
+class RotationCache:
+    def __init__(self, step = None, max_bytes = None):
+        self.cache = OrderedDict()
+        # masks are built on first use and dropped with their surface
+        self.masks = {}
+        self.mask_builds = 0
+        self.max_bytes = config.ROTATION_CACHE_BYTES if max_bytes is None else max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # time spent in get() is only measured while the profiler is running
+        self.timed = False
+        self.elapsed = 0.0
+        # rotozoom filters the result; plain rotate is cheaper but jagged
+        self.smooth = True
+        self.set_step(config.ROTATION_STEP if step is None else step)
+
+    def set_step(self, step):
+        """Change the angle resolution; cached surfaces are keyed by step index so they are dropped."""
+        self.step = step
+        self.steps = max(1, int(round(360 / step)))
+        self.clear()
+
+    def set_smooth(self, smooth):
+        self.smooth = smooth
+        self.clear()
+
+    def clear(self):
+        self.cache.clear()
+        self.masks.clear()
+        self.bytes = 0
+
+    # snap an angle to the index of the nearest cached rotation
+    def quantize(self, angle):
+        return int(round(angle * self.steps / 360.0)) % self.steps
+
+    def get(self, image, angle):
+        if self.timed:
+            start = time.perf_counter()
+            rotated = self._get(image, angle)
+            self.elapsed += time.perf_counter() - start
+            return rotated
+        return self._get(image, angle)
+
+    # return and reset the time measured since the last call
+    def take_elapsed(self):
+        elapsed = self.elapsed
+        self.elapsed = 0.0
+        return elapsed
+
+    def _get(self, image, angle):
+        key = (image, self.quantize(angle))
+        # unrotated images are used as they are
+        if key[1] == 0:
+            return image
+        rotated = self.cache.get(key)
+        if rotated is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return rotated
+        self.misses += 1
+        return self._build(key)
+
+    # pixel mask of the rotated image
+    def get_mask(self, image, angle):
+        key = (image, self.quantize(angle))
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = pygame.mask.from_surface(self._get(image, angle))
+            self.masks[key] = mask
+            self.mask_builds += 1
+        return mask
+
+    # eagerly build every rotation of an image, e.g. at load time
+    def prewarm(self, image):
+        for index in range(self.steps):
+            key = (image, index)
+            if key not in self.cache:
+                self._build(key)
+
+    def _build(self, key):
+        image, index = key
+        if self.smooth:
+            rotated = pygame.transform.rotozoom(image, index * 360.0 / self.steps, 1)
+        else:
+            rotated = pygame.transform.rotate(image, index * 360.0 / self.steps)
+        self.cache[key] = rotated
+        self.bytes += rotated.get_pitch() * rotated.get_height()
+        while self.bytes > self.max_bytes and len(self.cache) > 1:
+            dropped_key, dropped = self.cache.popitem(last = False)
+            self.masks.pop(dropped_key, None)
+            self.bytes -= dropped.get_pitch() * dropped.get_height()
+            self.evictions += 1
+        return rotated
+
+    def get_stats(self):
+        return {'entries': len(self.cache), 'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'masks': len(self.masks),
+                'mask_builds': self.mask_builds}
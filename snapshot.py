@@ -0,0 +1,383 @@
+#! python3
+'''
+Description         :   Binary game-state snapshots. A frame is a small header
+                        followed by a zlib-compressed payload holding the
+                        globals, the ship, one fixed-size record per entity and
+                        the RNG state. Delta frames XOR every section against
+                        the previous frame (entities matched by id), so
+                        whatever did not change compresses to almost nothing.
+                        Frames are used for save/restore, the rewind buffer and
+                        the spectator stream. Requires numpy.
+Usage               :   python snapshot.py bench           - size and speed
+                        python snapshot.py watch [PORT]    - spectate a game
+'''
+
+import sys
+import time
+import zlib
+import struct
+import socket
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import config
+
+MAGIC = b'ASTS'
+VERSION = 2
+KEY = 0
+DELTA = 1
+FRAME = struct.Struct('<4sHBxIIII')     # magic, version, kind, tick, base tick, payload length, raw length
+COUNTS = struct.Struct('<II')           # entities, rng bytes
+GLOBALS = struct.Struct('<Id')          # score, difficulty
+SHIP = struct.Struct('<6d??bxiIi')     # pos, vel, angle, angle_vel, thrust, firing, turn, lives, score, reload
+RANDOM = struct.Struct('<625I?d')       # Mersenne Twister state, gauss_next
+
+# entity kinds
+ASTEROID = 0
+EXPLOSION = 1
+MISSILE = 2
+
+# lag is how many ticks a sleeping asteroid is behind the game; it catches
+# up on its next update
+if np is not None:
+    ENTITY = np.dtype([('kind', 'u1'), ('flags', 'u1'), ('lag', '<u2'), ('age', '<u4'),
+                       ('pos', '<f8', 2), ('vel', '<f8', 2), ('angle', '<f8'), ('angle_vel', '<f8')])
+
+# Game state class; ship is a tuple in SHIP order, ids are sorted and match
+# the entity records one to one, rng is opaque bytes
+class GameState:
+    def __init__(self, tick, score, difficulty, ship, ids, entities, rng = b''):
+        self.tick = tick
+        self.score = score
+        self.difficulty = difficulty
+        self.ship = ship
+        self.ids = ids
+        self.entities = entities
+        self.rng = rng
+
+    def pack_fixed(self):
+        return GLOBALS.pack(self.score, self.difficulty) + SHIP.pack(*self.ship)
+
+# ids and entity records from (id, kind, age, pos, vel, angle, angle_vel, lag) records
+def record_arrays(records):
+    ids = np.fromiter((record[0] for record in records), dtype = np.uint32, count = len(records))
+    entities = np.array([(kind, 0, lag, age, pos, vel, angle, angle_vel)
+                         for ident, kind, age, pos, vel, angle, angle_vel, lag in records], dtype = ENTITY)
+    return ids, entities
+
+# build a state from records sorted by id, see record_arrays
+def make_state(tick, score, difficulty, ship, records, rng = b''):
+    ids, entities = record_arrays(records)
+    return GameState(tick, score, difficulty, ship, ids, entities, rng)
+
+# records for the entities of one kind from per-entity arrays
+def entity_array(kind, age, pos, vel, angle = 0.0, angle_vel = 0.0):
+    entities = np.zeros(len(age), dtype = ENTITY)
+    entities['kind'] = kind
+    entities['age'] = age
+    entities['pos'] = pos
+    entities['vel'] = vel
+    entities['angle'] = angle
+    entities['angle_vel'] = angle_vel
+    return entities
+
+# build a state from (ids, entities) pairs of arrays, e.g. one per storage;
+# the entities are sorted by id
+def join_state(tick, score, difficulty, ship, parts, rng = b''):
+    ids = np.concatenate([part[0] for part in parts]).astype(np.uint32)
+    entities = np.concatenate([part[1] for part in parts])
+    order = ids.argsort(kind = 'stable')
+    return GameState(tick, score, difficulty, ship, ids[order], entities[order], rng)
+
+# the random module's state as bytes and back
+def pack_random(state):
+    version, internal, gauss = state
+    return RANDOM.pack(*internal, gauss is not None, gauss or 0.0)
+
+def unpack_random(data):
+    values = RANDOM.unpack_from(data, 0)
+    return (3, values[:625], values[626] if values[625] else None)
+
+# XOR a with b, zero-extending or truncating b to the length of a
+def xor_bytes(a, b):
+    a = np.frombuffer(a, dtype = np.uint8)
+    other = np.zeros(len(a), dtype = np.uint8)
+    b = np.frombuffer(b, dtype = np.uint8)[:len(a)]
+    other[:len(b)] = b
+    return (a ^ other).tobytes()
+
+# base records lined up with ids; entities the base did not have are zero
+def aligned_rows(base, ids):
+    rows = np.zeros((len(ids), ENTITY.itemsize), dtype = np.uint8)
+    if len(base.ids) and len(ids):
+        index = np.minimum(np.searchsorted(base.ids, ids), len(base.ids) - 1)
+        found = base.ids[index] == ids
+        base_rows = base.entities.view(np.uint8).reshape(-1, ENTITY.itemsize)
+        rows[found] = base_rows[index[found]]
+    return rows
+
+# Encoder class; a key frame is written every interval ticks, and after
+# reset(), so a stream can be joined or cut at any key frame
+class Encoder:
+    def __init__(self, interval = None, level = 1):
+        if np is None:
+            raise ImportError("snapshots require numpy")
+        self.interval = interval or config.SNAPSHOT_KEY_INTERVAL
+        self.level = level
+        self.base = None
+        self.key_tick = 0
+        self.frames = 0
+        self.bytes = 0
+
+    def reset(self):
+        self.base = None
+
+    def encode(self, state):
+        key = self.base is None or state.tick - self.key_tick >= self.interval
+        base = None if key else self.base
+        ids = state.ids.astype('<u4')
+        rows = state.entities.view(np.uint8).reshape(-1, ENTITY.itemsize)
+        fixed = state.pack_fixed()
+        rng = state.rng
+        if base is not None:
+            fixed = xor_bytes(fixed, base.pack_fixed())
+            rows = rows ^ aligned_rows(base, ids)
+            rng = xor_bytes(rng, base.rng)
+        # ids are sorted, so their differences are small and compress well;
+        # records are stored byte column by byte column so the bytes that did
+        # not change (the high bytes of each float) form long runs of zeros
+        id_steps = np.diff(ids, prepend = np.uint32(0)).astype('<u4')
+        raw = b''.join((COUNTS.pack(len(ids), len(rng)), fixed, id_steps.tobytes(), rows.T.tobytes(), rng))
+        payload = zlib.compress(raw, self.level)
+        frame = FRAME.pack(MAGIC, VERSION, KEY if key else DELTA, state.tick,
+                           base.tick if base is not None else state.tick, len(payload), len(raw)) + payload
+        self.base = state
+        if key:
+            self.key_tick = state.tick
+        self.frames += 1
+        self.bytes += len(frame)
+        return frame
+
+    def get_stats(self):
+        return {'frames': self.frames, 'bytes': self.bytes,
+                'mean_bytes': self.bytes / self.frames if self.frames else 0}
+
+def frame_kind(frame):
+    return FRAME.unpack_from(frame, 0)[2]
+
+# Decoder class; delta frames must arrive in order after a key frame
+class Decoder:
+    def __init__(self):
+        if np is None:
+            raise ImportError("snapshots require numpy")
+        self.base = None
+
+    def decode(self, frame):
+        magic, version, kind, tick, base_tick, length, raw_length = FRAME.unpack_from(frame, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version %d snapshot' % VERSION)
+        base = None
+        if kind == DELTA:
+            if self.base is None or self.base.tick != base_tick:
+                raise ValueError('delta for tick %d needs the frame for tick %d' % (tick, base_tick))
+            base = self.base
+        raw = zlib.decompress(frame[FRAME.size:FRAME.size + length])
+
+        count, rng_length = COUNTS.unpack_from(raw, 0)
+        offset = COUNTS.size
+        fixed = raw[offset:offset + GLOBALS.size + SHIP.size]
+        offset += len(fixed)
+        ids = np.cumsum(np.frombuffer(raw, dtype = '<u4', count = count, offset = offset), dtype = np.uint32)
+        offset += count * 4
+        rows = np.frombuffer(raw, dtype = np.uint8, count = count * ENTITY.itemsize, offset = offset)
+        rows = rows.reshape(ENTITY.itemsize, count).T
+        offset += count * ENTITY.itemsize
+        rng = raw[offset:offset + rng_length]
+        if base is not None:
+            fixed = xor_bytes(fixed, base.pack_fixed())
+            rows = rows ^ aligned_rows(base, ids)
+            rng = xor_bytes(rng, base.rng)
+
+        score, difficulty = GLOBALS.unpack_from(fixed, 0)
+        ship = SHIP.unpack_from(fixed, GLOBALS.size)
+        entities = np.ascontiguousarray(rows).view(ENTITY).reshape(count)
+        state = GameState(tick, score, difficulty, ship, ids, entities, rng)
+        self.base = state
+        return state
+
+# read one frame from a file-like object; None at end of stream
+def read_frame(stream):
+    header = stream.read(FRAME.size)
+    if len(header) < FRAME.size:
+        return None
+    length = FRAME.unpack(header)[5]
+    return header + stream.read(length)
+
+def save(filename, state):
+    with open(filename, 'wb') as snapshot_file:
+        snapshot_file.write(Encoder().encode(state))
+
+def load(filename):
+    with open(filename, 'rb') as snapshot_file:
+        return Decoder().decode(snapshot_file.read())
+
+# Rewind buffer class; keeps the last capacity frames as encoded
+class RewindBuffer:
+    def __init__(self, capacity):
+        self.frames = deque(maxlen = capacity)
+
+    def push(self, frame):
+        self.frames.append(frame)
+
+    # state from ticks ago, clamped to the oldest frame that follows a key
+    # frame; later frames are dropped so the game carries on from there
+    def rewind(self, ticks):
+        frames = list(self.frames)
+        keys = [index for index, frame in enumerate(frames) if frame_kind(frame) == KEY]
+        if not keys:
+            return None
+        target = max(keys[0], len(frames) - 1 - ticks)
+        start = max(index for index in keys if index <= target)
+        decoder = Decoder()
+        for frame in frames[start:target + 1]:
+            state = decoder.decode(frame)
+        for index in range(len(frames) - 1 - target):
+            self.frames.pop()
+        return state
+
+# Spectator server class; streams frames to every connected client without
+# ever blocking the game. Clients joining mid-stream are sent the frames since
+# the last key frame first; a client that falls too far behind is dropped
+class SpectatorServer:
+    def __init__(self, port, max_backlog = 4 * 1024 * 1024):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.max_backlog = max_backlog
+        self.clients = {}
+        self.since_key = []
+
+    def publish(self, frame):
+        if frame_kind(frame) == KEY:
+            self.since_key = []
+        self.since_key.append(frame)
+        self.accept()
+        for client, backlog in list(self.clients.items()):
+            backlog += frame
+            self.flush(client, backlog)
+
+    def accept(self):
+        while True:
+            try:
+                client, address = self.listener.accept()
+            except BlockingIOError:
+                return
+            client.setblocking(False)
+            self.clients[client] = bytearray(b''.join(self.since_key[:-1]))
+
+    def flush(self, client, backlog):
+        try:
+            sent = client.send(backlog)
+            del backlog[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(client)
+            return
+        if len(backlog) > self.max_backlog:
+            self.drop(client)
+
+    def drop(self, client):
+        client.close()
+        del self.clients[client]
+
+    def close(self):
+        for client in list(self.clients):
+            self.drop(client)
+        self.listener.close()
+
+# show a game being played elsewhere; every frame received is restored into
+# this process and drawn
+def watch(port):
+    import asteroids
+    asteroids.init()
+    connection = socket.create_connection(('127.0.0.1', port))
+    stream = connection.makefile('rb')
+    decoder = Decoder()
+    player = asteroids.new_game()
+    environment = asteroids.Background()
+    while True:
+        frame = read_frame(stream)
+        if frame is None:
+            break
+        asteroids.restore_state(decoder.decode(frame), player)
+        for event in asteroids.pygame.event.get():
+            if event.type == asteroids.KEYDOWN and event.key == asteroids.K_ESCAPE:
+                asteroids.exit_game()
+        environment.update()
+        asteroids.draw_frame(environment, player)
+
+# a synthetic state of count entities moving in a straight line
+def synthetic_state(tick, count, rng):
+    entities = np.zeros(count, dtype = ENTITY)
+    entities['kind'] = ASTEROID
+    entities['age'] = tick
+    start = np.random.default_rng(0).uniform(0, 600, size = (count, 2))
+    velocity = np.random.default_rng(1).uniform(-2, 2, size = (count, 2))
+    entities['pos'] = (start + velocity * tick) % config.WORLDSIZE
+    entities['vel'] = velocity
+    ship = (100.0 + tick, 100.0, 0.5, 0.0, float(tick % 360), 5.0, True, False, 1, 3, 0, 0)
+    return GameState(tick, tick // 10, tick * 0.001, ship, np.arange(count, dtype = np.uint32), entities, rng)
+
+# seconds per asteroids.capture_state() call with count asteroids in play;
+# the asteroids are sprites or a numpy field as config.NUMPY_PHYSICS says
+def time_capture(count, runs = 20):
+    import asteroids
+    asteroids.init(run_headless = True)
+    player = asteroids.new_game()
+    rng = np.random.default_rng(0)
+    while len(asteroids.enemy_group) < count:
+        pos = rng.uniform(0, 1, size = 2) * config.WORLDSIZE
+        asteroids.enemy_group.add(asteroids.new_asteroid(pos.tolist(), [1.0, 0.0], 0, 0))
+    # the first capture hands out the ids
+    asteroids.capture_state(player)
+    start = time.perf_counter()
+    for run in range(runs):
+        asteroids.capture_state(player)
+    return (time.perf_counter() - start) / runs
+
+def bench(counts = (12, 100, 1000, 5000), ticks = 300):
+    rng = bytes(2600)
+    print('%8s %10s %10s %12s %12s %12s %12s' % ('entities', 'key bytes', 'delta bytes', 'capture us',
+                                                 'encode us', 'decode us', 'raw bytes'))
+    for count in counts:
+        capture = time_capture(count)
+        states = [synthetic_state(tick, count, rng) for tick in range(ticks)]
+        encoder = Encoder(interval = ticks)
+        start = time.perf_counter()
+        frames = [encoder.encode(state) for state in states]
+        encode = (time.perf_counter() - start) / ticks
+        decoder = Decoder()
+        start = time.perf_counter()
+        for frame in frames:
+            decoder.decode(frame)
+        decode = (time.perf_counter() - start) / ticks
+        raw = COUNTS.size + GLOBALS.size + SHIP.size + count * (4 + ENTITY.itemsize) + len(rng)
+        print('%8d %10d %10.0f %12.1f %12.1f %12.1f %12d' % (count, len(frames[0]), sum(map(len, frames[1:])) / (ticks - 1),
+                                                         capture * 1e6, encode * 1e6, decode * 1e6, raw))
+    print('capture is asteroids.capture_state() with config.NUMPY_PHYSICS =', config.NUMPY_PHYSICS)
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'bench'
+    if command == 'bench':
+        bench()
+    elif command == 'watch':
+        watch(int(sys.argv[2]) if len(sys.argv) > 2 else config.SPECTATOR_PORT or 7777)
+    else:
+        print(__doc__)
@@ -0,0 +1,104 @@
+#! python3
+'''
+Description         :   Uniform grid used as the collision broadphase. The
+                        grid wraps toroidally like the world, so sprites on
+                        opposite edges land in neighbouring cells.
+'''
+
+import math
+import config
+
+# squared distance between two points; compare it with a squared reach to
+# save the square root
+def dist_sq(p, q):
+    dx = p[0] - q[0]
+    dy = p[1] - q[1]
+    return dx * dx + dy * dy
+
+# Spatial hash class; sprites are bucketed by the cell containing their centre
+class SpatialHash:
+    def __init__(self, cell_size = None, world_size = None):
+        cell_size = cell_size or config.COLLISION_CELL_SIZE
+        self.world_size = world_size or config.WORLDSIZE
+        # stretch the cells slightly so a whole number of them tiles the world
+        self.cols = max(1, int(math.ceil(self.world_size[0] / cell_size)))
+        self.rows = max(1, int(math.ceil(self.world_size[1] / cell_size)))
+        self.cell_w = self.world_size[0] / self.cols
+        self.cell_h = self.world_size[1] / self.rows
+        self.cells = {}
+        self.where = {}
+        self.max_radius = 0
+        self.borders = {}
+
+    def __len__(self):
+        return len(self.where)
+
+    def cell_of(self, pos):
+        return (int((pos[0] % self.world_size[0]) / self.cell_w) % self.cols,
+                int((pos[1] % self.world_size[1]) / self.cell_h) % self.rows)
+
+    def clear(self):
+        self.cells.clear()
+        self.where.clear()
+        self.max_radius = 0
+
+    # rebuild the whole grid from a group, once per frame
+    def rebuild(self, group):
+        self.clear()
+        for sprite in group:
+            self.insert(sprite)
+
+    def insert(self, sprite):
+        cell = self.cell_of(sprite.get_position())
+        self.cells.setdefault(cell, []).append(sprite)
+        self.where[sprite] = cell
+        if sprite.get_radius() > self.max_radius:
+            self.max_radius = sprite.get_radius()
+
+    def remove(self, sprite):
+        cell = self.where.pop(sprite, None)
+        if cell is not None:
+            self.cells[cell].remove(sprite)
+
+    # incremental alternative to rebuild() for a sprite that has moved
+    def move(self, sprite):
+        cell = self.cell_of(sprite.get_position())
+        if self.where.get(sprite) != cell:
+            self.remove(sprite)
+            self.insert(sprite)
+
+    # return the sprites in every cell within reach of a position
+    def query(self, pos, reach):
+        col_range = self._span(pos[0], reach, self.cell_w, self.cols)
+        row_range = self._span(pos[1], reach, self.cell_h, self.rows)
+        found = []
+        for col in col_range:
+            for row in row_range:
+                bucket = self.cells.get((col, row))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    # return the sprites whose cell lies within margin of an edge; the cells
+    # in the band are worked out once per margin
+    def border(self, margin):
+        keys = self.borders.get(margin)
+        if keys is None:
+            cols = int(math.ceil(margin / self.cell_w))
+            rows = int(math.ceil(margin / self.cell_h))
+            keys = [(col, row) for col in range(self.cols) for row in range(self.rows)
+                    if col < cols or col >= self.cols - cols or row < rows or row >= self.rows - rows]
+            self.borders[margin] = keys
+        found = []
+        for key in keys:
+            bucket = self.cells.get(key)
+            if bucket:
+                found.extend(bucket)
+        return found
+
+    def _span(self, centre, reach, size, count):
+        first = int(math.floor((centre - reach) / size))
+        last = int(math.floor((centre + reach) / size))
+        if last - first + 1 >= count:
+            return range(count)
+        return set(index % count for index in range(first, last + 1))
@@ -0,0 +1,87 @@
+#! python3
+'''
+Description         :   Vectorised spawn placement. Candidate positions are
+                        sampled in batches and checked against the player in
+                        one NumPy distance test, then against the asteroids
+                        near each of them; candidates that pass are kept for
+                        later frames. Requires numpy.
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import struct
+import config
+from spatial import dist_sq
+
+PCG_STATE = struct.Struct('<16s16sBI')   # state, increment, has_uint32, uinteger
+
+# Spawn planner class; at most one batch is sampled and tested per call
+class SpawnPlanner:
+    def __init__(self, batch = None, world_size = None):
+        if np is None:
+            raise ImportError("SpawnPlanner requires numpy")
+        self.batch = batch or config.SPAWN_BATCH
+        self.world_size = np.array(world_size or config.WORLDSIZE, dtype = np.float64)
+        self.sampled = 0
+        self.placed = 0
+        self.empty_frames = 0
+        self.reset(0)
+
+    # seed from the game's RNG so spawns follow random.seed()
+    def reset(self, seed):
+        self.rng = np.random.default_rng(seed)
+        self.cache = np.empty((0, 2))
+
+    # return a position at least player_clearance from the player and
+    # clearance from every asteroid, or None if no candidate passed this
+    # frame. nearby(pos, reach) returns the centres of the asteroids that
+    # may be within reach of pos, e.g. from the collision grid, so the work
+    # per candidate depends on how crowded its neighbourhood is rather than
+    # on how many asteroids there are; a candidate is dropped at the first
+    # asteroid too close to it
+    def place(self, player_pos, player_clearance, nearby, clearance):
+        if not len(self.cache):
+            self.cache = self.rng.uniform((0, 0), self.world_size, size = (self.batch, 2))
+            self.sampled += self.batch
+        candidates = self.cache
+
+        offset = candidates - np.asarray(player_pos, dtype = np.float64)
+        valid = np.einsum('ij,ij->i', offset, offset) > player_clearance * player_clearance
+        limit = clearance * clearance
+        for index in np.flatnonzero(valid).tolist():
+            pos = candidates[index].tolist()
+            for other in nearby(pos, clearance):
+                if dist_sq(pos, other) <= limit:
+                    valid[index] = False
+                    break
+
+        candidates = candidates[valid]
+        if not len(candidates):
+            self.cache = candidates
+            self.empty_frames += 1
+            return None
+        # the rest stay cached and are re-tested next frame as things move
+        self.cache = candidates[1:]
+        self.placed += 1
+        return candidates[0].tolist()
+
+    # generator state and cached candidates as bytes, for snapshots
+    def get_state(self):
+        state = self.rng.bit_generator.state
+        return PCG_STATE.pack(state['state']['state'].to_bytes(16, 'little'), state['state']['inc'].to_bytes(16, 'little'),
+                              state['has_uint32'], state['uinteger']) + self.cache.tobytes()
+
+    def set_state(self, data):
+        value, increment, has_uint32, uinteger = PCG_STATE.unpack_from(data, 0)
+        self.rng.bit_generator.state = {'bit_generator': 'PCG64',
+                                        'state': {'state': int.from_bytes(value, 'little'),
+                                                  'inc': int.from_bytes(increment, 'little')},
+                                        'has_uint32': has_uint32, 'uinteger': uinteger}
+        self.cache = np.frombuffer(data, dtype = np.float64, offset = PCG_STATE.size).reshape(-1, 2).copy()
+
+    def get_stats(self):
+        return {'sampled': self.sampled, 'placed': self.placed, 'empty_frames': self.empty_frames,
+                'cached': len(self.cache)}
@@ -0,0 +1,138 @@
+#! python3
+'''
+Description         :   Screen wraparound. The world is a torus the size of
+                        the screen, so a sprite whose rect crosses an edge is
+                        also drawn, and collided, a screen width or height
+                        away on the far side. Only the sprites in a band of
+                        border grid cells are checked each tick, which keeps
+                        the cost to the few sprites near an edge.
+'''
+
+import config
+from spatial import dist_sq
+
+# pixels added to a sprite's half size; covers the distance it can move
+# between the tick that found it and the interpolated frame that draws it
+SLACK = 8
+
+# Ghost class; a sprite seen through the wrap, used as a collision proxy
+class Ghost:
+    __slots__ = ('owner', 'offset')
+
+    def __init__(self, owner, offset):
+        self.owner = owner
+        self.offset = offset
+
+    @property
+    def orig_image(self):
+        return self.owner.orig_image
+
+    def get_radius(self):
+        return self.owner.get_radius()
+
+    def get_position(self):
+        pos = self.owner.get_position()
+        return [pos[0] + self.offset[0], pos[1] + self.offset[1]]
+
+    def get_centre(self):
+        return self.get_position()
+
+    def get_angle(self):
+        return self.owner.get_angle()
+
+    def collide(self, other_object):
+        radii = self.get_radius() + other_object.get_radius()
+        return dist_sq(self.get_position(), other_object.get_position()) < radii * radii
+
+# Edge band class; margin is the largest half size of any sprite that can be
+# in the broadphase grid and is set once the images are loaded
+class EdgeBand:
+    def __init__(self, margin = 0, world_size = None):
+        self.margin = margin
+        self.world_size = world_size or config.WORLDSIZE
+        self.offsets = {}       # sprite: ghost offsets, for this tick
+        self.groups = {}        # sprite: the group it must still be in to be drawn
+        self.ghosts = {}        # sprite: Ghost proxies, made on first use
+        self.ticks = 0
+        self.edge_total = 0
+
+    # offsets of the copies of a rect centred on pos that show on screen
+    def offsets_for(self, pos, half_width, half_height):
+        width, height = self.world_size
+        if (half_width <= pos[0] <= width - half_width and
+                half_height <= pos[1] <= height - half_height):
+            return None
+        xs = [0]
+        if pos[0] - half_width < 0:
+            xs.append(width)
+        elif pos[0] + half_width > width:
+            xs.append(-width)
+        ys = [0]
+        if pos[1] - half_height < 0:
+            ys.append(height)
+        elif pos[1] + half_height > height:
+            ys.append(-height)
+        return [(x, y) for x in xs for y in ys if x or y]
+
+    def add(self, sprite, group = None):
+        rect = getattr(sprite, 'rect', None)
+        if rect is not None:
+            half_width = rect.width / 2.0 + SLACK
+            half_height = rect.height / 2.0 + SLACK
+        else:
+            # round sprites without a rect, e.g. missiles
+            half_width = half_height = sprite.get_radius() + SLACK
+        offsets = self.offsets_for(sprite.get_position(), half_width, half_height)
+        if offsets:
+            self.offsets[sprite] = offsets
+            self.groups[sprite] = group
+
+    # find this tick's edge sprites: the player, every sprite in the grid's
+    # border cells and the missiles near an edge
+    def find(self, player, index, missiles = None, group = None):
+        self.offsets.clear()
+        self.groups.clear()
+        self.ghosts.clear()
+        self.add(player)
+        for sprite in index.border(self.margin + SLACK):
+            self.add(sprite, group)
+        if missiles is not None:
+            for missile in missiles.near_edges(self.margin + SLACK):
+                self.add(missile, missiles)
+        self.ticks += 1
+        self.edge_total += len(self.offsets)
+
+    # sprites that are not in the grid, e.g. explosions
+    def scan(self, group):
+        for sprite in group:
+            self.add(sprite, group)
+
+    # collision proxies for a sprite; empty unless it crosses an edge
+    def proxies(self, sprite):
+        offsets = self.offsets.get(sprite)
+        if offsets is None:
+            return ()
+        ghosts = self.ghosts.get(sprite)
+        if ghosts is None:
+            ghosts = self.ghosts[sprite] = [Ghost(sprite, offset) for offset in offsets]
+        return ghosts
+
+    # (image, rect) pairs for the ghost copies of the edge sprites added with
+    # group (None for the player) and still in it; call after the sprites
+    # have been drawn so their rects are at the interpolated position.
+    # Missiles draw their own
+    def get_blits(self, group = None):
+        blits = []
+        for sprite, offsets in self.offsets.items():
+            rect = getattr(sprite, 'rect', None)
+            if rect is None or self.groups[sprite] is not group:
+                continue
+            if group is not None and sprite not in group:
+                continue
+            image = sprite.image
+            blits += [(image, rect.move(offset)) for offset in offsets]
+        return blits
+
+    def get_stats(self):
+        return {'edge_sprites': len(self.offsets),
+                'mean_edge_sprites': self.edge_total / self.ticks if self.ticks else 0.0}